@@ -1,4 +1,5 @@
 """Junkers Heatronic 3 integration"""
+import json
 import logging
 
 import voluptuous as vol
@@ -11,11 +12,24 @@ import homeassistant.helpers.config_validation as cv
 from homeassistant import config_entries
 from homeassistant.const import CONF_HOST, CONF_PORT
 from homeassistant.const import EVENT_HOMEASSISTANT_START, EVENT_HOMEASSISTANT_STOP
-
-from .const import DOMAIN, KEY_GATEWAY, EVENT, SERVICE_RECONNECT, MANUFACTURER
+from homeassistant.core import callback
+from homeassistant.helpers import entity_registry as er
+
+from .const import (
+    ATTR_ENTRY_ID,
+    DOMAIN,
+    KEY_GATEWAY,
+    KEY_MANAGER,
+    SERVICE_RECONNECT,
+    SERVICE_DUMP_FRAMES,
+    MANUFACTURER,
+    SENSOR_DICT,
+)
 
 _LOGGER = logging.getLogger(__name__)
 
+PLATFORMS = ["climate", "sensor", "binary_sensor"]
+
 CONFIG_SCHEMA = vol.Schema(
     {
         DOMAIN: vol.Schema(
@@ -53,27 +67,41 @@ async def async_setup(hass, config):
 
 
 async def async_setup_entry(hass, entry):
-    from .driver import Ht3Driver
+    from .manager import GatewayManager
 
-    driver = Ht3Driver(entry.data[CONF_HOST], entry.data[CONF_PORT])
+    manager = hass.data.get(KEY_MANAGER)
+    if manager is None:
+        # one manager runs the drivers of all gateways on the event loop
+        manager = hass.data[KEY_MANAGER] = GatewayManager()
 
-    async def start_ht3_driver(self):
-        driver.start()
+        async def start_ht3_drivers(self):
+            manager.start()
 
-    hass.bus.async_listen_once(EVENT_HOMEASSISTANT_START, start_ht3_driver)
+        async def stop_ht3_clients(self):
+            """Close connections when hass stops."""
+            await manager.stop()
 
-    async def stop_ht3_client(self):
-        """Close connection when hass stops."""
-        driver.stop()
+        if hass.is_running:
+            manager.start()
+        else:
+            hass.bus.async_listen_once(EVENT_HOMEASSISTANT_START, start_ht3_drivers)
+        hass.bus.async_listen_once(EVENT_HOMEASSISTANT_STOP, stop_ht3_clients)
 
-    hass.bus.async_listen_once(EVENT_HOMEASSISTANT_STOP, stop_ht3_client)
+    driver = manager.add(entry.entry_id, entry.data[CONF_HOST], entry.data[CONF_PORT])
+    driver.set_filters(
+        {name: info[4] for name, info in SENSOR_DICT.items() if info[4] is not None}
+    )
 
     hass.data.setdefault(KEY_GATEWAY, {})[entry.entry_id] = driver
 
-    def handle_value_changed(name, value):
-        hass.bus.fire(EVENT, {"name": name, "value": value})
+    @callback
+    def migrate_unique_id(entity_entry):
+        """Prefix the unique IDs of the value entities with the entry ID."""
+        if entity_entry.unique_id.startswith(f"{entry.entry_id}/"):
+            return None
+        return {"new_unique_id": f"{entry.entry_id}/{entity_entry.unique_id}"}
 
-    driver.set_callback(handle_value_changed)
+    await er.async_migrate_entries(hass, entry.entry_id, migrate_unique_id)
 
     _LOGGER.info("Connected to HT3 bus")
 
@@ -104,13 +132,69 @@ async def async_setup_entry(hass, entry):
     #     sw_version="v1.0",
     # )
 
-    # service registry
-    async def async_reconnect(self):
-        _LOGGER.info("Reconnect to HT3 bus")
-        driver.stop()
-        # driver = Ht3Driver(entry.data[CONF_HOST], entry.data[CONF_PORT])
-        driver.restart()
+    if not hass.services.has_service(DOMAIN, SERVICE_RECONNECT):
+        _async_register_services(hass)
+
+    return True
+
+
+async def async_unload_entry(hass, entry):
+    """Unload the entities of an entry and release its gateway."""
+    if not await hass.config_entries.async_unload_platforms(entry, PLATFORMS):
+        return False
 
-    hass.services.async_register(DOMAIN, SERVICE_RECONNECT, async_reconnect)
+    # the connection is closed once no other entry uses the proxy
+    await hass.data[KEY_MANAGER].remove(entry.entry_id)
+    gateways = hass.data[KEY_GATEWAY]
+    gateways.pop(entry.entry_id, None)
+
+    if not gateways:
+        for service in (SERVICE_RECONNECT, SERVICE_DUMP_FRAMES):
+            hass.services.async_remove(DOMAIN, service)
 
     return True
+
+
+def _async_register_services(hass):
+    """Register the services once, for the gateways of all entries."""
+
+    async def async_reconnect(call):
+        """Reconnect the gateway of one entry, or all gateways."""
+        gateways = hass.data[KEY_GATEWAY]
+        entry_id = call.data.get(ATTR_ENTRY_ID)
+        if entry_id is not None:
+            if entry_id not in gateways:
+                _LOGGER.error("No HT3 gateway for entry %s", entry_id)
+                return
+            drivers = {gateways[entry_id]}
+        else:
+            # entries on one proxy share their driver
+            drivers = set(gateways.values())
+        _LOGGER.info("Reconnect to HT3 bus")
+        for driver in drivers:
+            await driver.async_stop()
+            driver.restart()
+
+    hass.services.async_register(
+        DOMAIN,
+        SERVICE_RECONNECT,
+        async_reconnect,
+        schema=vol.Schema({vol.Optional(ATTR_ENTRY_ID): cv.string}),
+    )
+
+    async def async_dump_frames(call):
+        """Write the frame logs of all gateways to the config directory."""
+        dump = {
+            entry_id: driver.diagnostics()
+            for entry_id, driver in hass.data[KEY_GATEWAY].items()
+        }
+        path = hass.config.path(f"{DOMAIN}_frames.json")
+
+        def write():
+            with open(path, "w", encoding="utf-8") as file:
+                json.dump(dump, file, indent=2)
+
+        await hass.async_add_executor_job(write)
+        _LOGGER.info("HT3 frame log written to %s", path)
+
+    hass.services.async_register(DOMAIN, SERVICE_DUMP_FRAMES, async_dump_frames)
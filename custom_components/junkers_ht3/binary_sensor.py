@@ -3,7 +3,7 @@ import logging
 
 from homeassistant.components.binary_sensor import BinarySensorEntity
 from homeassistant.config_entries import ConfigEntry
-from homeassistant.core import HomeAssistant
+from homeassistant.core import HomeAssistant, callback
 from homeassistant.helpers.entity_platform import AddEntitiesCallback
 from homeassistant.helpers.entity import DeviceInfo
 
@@ -12,7 +12,7 @@ from .const import (
     BINARY_SENSOR_LIST,
     MANUFACTURER,
     DOMAIN,
-    EVENT,
+    KEY_GATEWAY,
     DEVICE_NAME,
     DEVICE_MODEL,
     DEVICE_SW_VERSION,
@@ -27,9 +27,11 @@ async def async_setup_entry(
     async_add_entities: AddEntitiesCallback,
 ) -> None:
     """Set up the HT3 sensor."""
+    driver = hass.data[KEY_GATEWAY][config_entry.entry_id]
     sensors = [
         Ht3BinarySensor(
             hass=hass,
+            driver=driver,
             resource=sensor_name,
             entry_id=config_entry.entry_id,
         )
@@ -41,13 +43,14 @@ async def async_setup_entry(
 class Ht3BinarySensor(BinarySensorEntity):
     """Representation of a Sensor."""
 
-    def __init__(self, hass, resource, entry_id):
+    def __init__(self, hass, driver, resource, entry_id):
         """Initialize the sensor."""
         variable_info = BINARY_SENSOR_DICT[resource]
         self._state = False
         self._name = variable_info[0] if variable_info[0] else resource
         self._resource = resource
         self._entry_id = entry_id
+        self._driver = driver
 
         # self._name = variable_info[0]
         self._device_class = variable_info[2]
@@ -55,12 +58,10 @@ class Ht3BinarySensor(BinarySensorEntity):
 
         self._available = False
 
-        hass.bus.async_listen(EVENT, self._handle_code)
-
     @property
     def unique_id(self) -> str:
         """Return a unique ID."""
-        return f"{self._resource}"
+        return f"{self._entry_id}/{self._resource}"
 
     @property
     def icon(self) -> str:
@@ -98,24 +99,20 @@ class Ht3BinarySensor(BinarySensorEntity):
         """Return True if entity is available."""
         return self._available
 
-    def _handle_code(self, call):
-        """Handle received code by the ht3-daemon.
-        If the code matches the defined payload
-        of this sensor the sensor state is changed accordingly.
-        """
-        # Check if received code matches defined payload
-        # True if payload is contained in received code dict, not
-        # all items have to match
-        if self._resource == call.data.get("name"):
-            try:
-                value = call.data["value"]
-                self._state = True if value == 1 else False
-                self._available = True
-                self.async_schedule_update_ha_state(False)
-            except KeyError:
-                _LOGGER.error(
-                    "No variable %s in received code data %s",
-                    str(self._resource),
-                    str(call.data),
-                )
-                self._available = False
+    async def async_added_to_hass(self) -> None:
+        """Subscribe to value changes of the ht3-daemon."""
+        if self._resource in self._driver.dict:
+            self._set_state(self._driver.dict[self._resource])
+        self.async_on_remove(
+            self._driver.subscribe((self._resource,), self._handle_values)
+        )
+
+    def _set_state(self, value):
+        self._state = True if value == 1 else False
+        self._available = True
+
+    @callback
+    def _handle_values(self, changes):
+        """Handle a changed value of this sensor received by the ht3-daemon."""
+        self._set_state(changes[self._resource])
+        self.async_write_ha_state()
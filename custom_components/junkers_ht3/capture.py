@@ -0,0 +1,193 @@
+"""Capture and replay of the raw Heatronic 3 byte stream"""
+import asyncio
+import logging
+import struct
+import time
+
+_LOGGER = logging.getLogger(__name__)
+
+MAGIC = b"HT3CAP1\n"
+
+# record header: monotonic timestamp in seconds, chunk length in bytes
+RECORD = struct.Struct("<dI")
+# length of the record starting a capture session, its timestamp is the
+# wall clock: monotonic timestamps only compare within one session
+SESSION = 0xFFFFFFFF
+
+FRAME_LOG_SIZE = 256
+CAPTURE_BUFFER_SIZE = 4096
+
+
+class CaptureWriter:
+    """Append received chunks with their monotonic timestamp to a file.
+
+    The file starts with `MAGIC` and holds one record per chunk: the
+    `RECORD` header followed by the chunk as received from the socket.
+    Every writer starts a session with a `SESSION` record, so a capture
+    appended to by another process or after a reboot still replays with
+    the spacing of each session.
+
+    Records are collected in memory and written by the default executor
+    once `buffer_size` bytes are pending, so the event loop never waits
+    for the disk. One write runs at a time, which keeps the records in
+    order; must be created inside the event loop.
+    """
+
+    def __init__(self, path, buffer_size=CAPTURE_BUFFER_SIZE):
+        self.path = path
+        self.buffer_size = buffer_size
+        self._loop = asyncio.get_running_loop()
+        self._file = None
+        self._buffer = bytearray(RECORD.pack(time.time(), SESSION))
+        self._writing = None
+        self._closing = False
+        self._closed = self._loop.create_future()
+        self.chunks = 0
+        self.bytes = 0
+
+    def write(self, data, timestamp=None):
+        """Record one chunk."""
+        if self._closing:
+            return
+        if timestamp is None:
+            timestamp = time.monotonic()
+        self._buffer += RECORD.pack(timestamp, len(data))
+        self._buffer += data
+        self.chunks += 1
+        self.bytes += len(data)
+        if len(self._buffer) >= self.buffer_size:
+            self._flush()
+
+    def close(self):
+        """Write the pending records and close the file.
+
+        Returns a future that is done once the file is closed.
+        """
+        if not self._closing:
+            self._closing = True
+            self._flush()
+        return self._closed
+
+    def _flush(self):
+        if self._writing is not None:
+            # picked up when the running write is done
+            return
+        data = bytes(self._buffer)
+        self._buffer.clear()
+        self._writing = self._loop.run_in_executor(
+            None, self._write_file, data, self._closing
+        )
+        self._writing.add_done_callback(self._written)
+
+    def _write_file(self, data, close):
+        # runs in the executor
+        try:
+            if self._file is None:
+                self._file = open(self.path, "ab")
+                if self._file.tell() == 0:
+                    self._file.write(MAGIC)
+            self._file.write(data)
+        except OSError:
+            if self._file is not None:
+                self._file.close()
+            raise
+        if close:
+            self._file.close()
+
+    def _written(self, future):
+        self._writing = None
+        if future.cancelled():
+            return
+        error = future.exception()
+        if error is not None:
+            _LOGGER.error("Capture to %s stopped: %s", self.path, error)
+            self._closing = True
+            self._buffer.clear()
+            self._closed.set_result(None)
+        elif self._file.closed:
+            self._closed.set_result(None)
+        elif self._buffer or self._closing:
+            self._flush()
+
+
+class FrameLog:
+    """Ring buffer of the last `size` raw frames.
+
+    The slots are allocated up front and overwritten in turn, so logging
+    a frame is one tuple per frame and no reader is needed to keep it
+    bounded. Entries are (timestamp, raw bytes, outcome), the outcomes are
+    those of the FrameScanner. The owner sets `time` once per received
+    chunk instead of reading the clock per frame.
+    """
+
+    def __init__(self, size=FRAME_LOG_SIZE):
+        self.size = size
+        self._entries = [None] * size
+        self._next = 0
+        self.count = 0
+        self.time = 0.0
+
+    def add(self, frame, outcome):
+        """Log one frame, replacing the oldest one."""
+        self._entries[self._next] = (self.time, frame, outcome)
+        self._next = (self._next + 1) % self.size
+        self.count += 1
+
+    def entries(self):
+        """Logged frames, oldest first, for diagnostics."""
+        entries = self._entries[self._next :] + self._entries[: self._next]
+        return [
+            {"time": round(entry[0], 3), "frame": entry[1].hex(), "outcome": entry[2]}
+            for entry in entries
+            if entry is not None
+        ]
+
+
+def read_capture(path, sessions=False):
+    """Yield (timestamp, chunk) tuples from a capture file.
+
+    With `sessions` the start of each capture session is yielded as well,
+    as (wall clock time, None).
+    """
+    with open(path, "rb") as file:
+        if file.read(len(MAGIC)) != MAGIC:
+            raise ValueError("{} is not a HT3 capture".format(path))
+        while True:
+            header = file.read(RECORD.size)
+            if len(header) < RECORD.size:
+                return
+            timestamp, length = RECORD.unpack(header)
+            if length == SESSION:
+                if sessions:
+                    yield timestamp, None
+                continue
+            data = file.read(length)
+            if len(data) < length:
+                return  # capture cut off while writing
+            yield timestamp, data
+
+
+async def replay(path, handler, speed=1.0):
+    """Feed a capture into `handler(chunk)`, returns the number of chunks.
+
+    With `speed` 1.0 the chunks are fed with their recorded spacing, 2.0
+    replays twice as fast; 0 feeds them as fast as possible while still
+    yielding to the event loop between chunks. The spacing of chunks is
+    only kept within a capture session.
+    """
+    chunks = 0
+    start = first = None
+    for timestamp, data in read_capture(path, sessions=True):
+        if data is None:
+            first = None
+            continue
+        if speed:
+            if first is None:
+                first, start = timestamp, time.monotonic()
+            delay = (timestamp - first) / speed - (time.monotonic() - start)
+            await asyncio.sleep(max(delay, 0))
+        else:
+            await asyncio.sleep(0)
+        handler(data)
+        chunks += 1
+    return chunks
@@ -18,13 +18,12 @@ from homeassistant.const import (
 
 from homeassistant.helpers.entity import DeviceInfo
 from homeassistant.config_entries import ConfigEntry
-from homeassistant.core import HomeAssistant
+from homeassistant.core import HomeAssistant, callback
 from homeassistant.helpers.entity_platform import AddEntitiesCallback
 from .driver import Ht3Driver
 
 from .const import (
     DOMAIN,
-    EVENT,
     KEY_GATEWAY,
     MANUFACTURER,
     DEVICE_NAME,
@@ -40,8 +39,14 @@ PRESET_COMFORT = "Comfort"
 PRESET_ECO = "Eco"
 PRESET_FROST = "Frost"
 
+# hc_auto first, the mode depends on it
+CLIMATE_VALUES = ("hc_auto", "hc_Tdesired", "hc_Tmeasured", "hc_mode")
+
 ATTR_CONNECTED = "Connected"
 ATTR_CLIENT_ID = "Client ID"
+ATTR_QUEUE_DEPTH = "Write queue depth"
+ATTR_WRITE_LATENCY = "Write latency"
+ATTR_WRITE_RTT = "Write round trip"
 
 
 async def async_setup_entry(
@@ -80,8 +85,6 @@ class Ht3Climate(ClimateEntity):
         self._away = False
         self._hold = False
 
-        hass.bus.async_listen(EVENT, self._handle_code)
-
     # async def async_will_remove_from_hass(self):
     #     """Unsubscribe when removed."""
     #     self._sub_state = await subscription.async_unsubscribe_topics(
@@ -90,76 +93,54 @@ class Ht3Climate(ClimateEntity):
     #     await MqttAttributes.async_will_remove_from_hass(self)
     #     await MqttAvailability.async_will_remove_from_hass(self)
 
-    def _handle_code(self, call):
-        """Handle received code by the ht3-daemon.
-        If the code matches the defined payload
-        of this sensor the sensor state is changed accordingly.
-        """
-        # Check if received code matches defined payload
-        # True if payload is contained in received code dict, not
-        # all items have to match
-        if "hc_Tdesired" == call.data.get("name"):
-            try:
-                value = call.data["value"]
-                self._target_temp = value
-                self.schedule_update_ha_state()
-            except KeyError:
-                _LOGGER.error(
-                    "No variable 'hc_Tdesired' in received code data %s",
-                    str(call.data),
-                )
-        elif "hc_Tmeasured" == call.data.get("name"):
-            try:
-                value = call.data["value"]
-                self._current_temp = value
-                self.schedule_update_ha_state()
-            except KeyError:
-                _LOGGER.error(
-                    "No variable 'hc_Tmeasured' in received code data %s",
-                    str(call.data),
+    async def async_added_to_hass(self) -> None:
+        """Subscribe to value changes of the ht3-daemon."""
+        for name in CLIMATE_VALUES:
+            if name in self.driver.dict:
+                self._set_value(name, self.driver.dict[name])
+        self.async_on_remove(
+            self.driver.subscribe(CLIMATE_VALUES, self._handle_values)
+        )
+
+    def _set_value(self, name, value):
+        if name == "hc_Tdesired":
+            self._target_temp = value
+        elif name == "hc_Tmeasured":
+            self._current_temp = value
+        elif name == "hc_mode":
+            if value == 1:
+                self._current_operation = (
+                    HVACMode.OFF if not self._auto else HVACMode.AUTO
                 )
-        elif "hc_mode" == call.data.get("name"):
-            try:
-                value = call.data["value"]
-                if value == 1:
-                    self._current_operation = (
-                        HVACMode.OFF if not self._auto else HVACMode.AUTO
-                    )
-                    self._preset = PRESET_FROST
-                elif value == 2:
-                    self._current_operation = (
-                        HVACMode.OFF if not self._auto else HVACMode.AUTO
-                    )
-                    self._preset = PRESET_ECO
-                elif value == 3:
-                    self._current_operation = (
-                        HVACMode.HEAT if not self._auto else HVACMode.AUTO
-                    )
-                    self._preset = PRESET_COMFORT
-                elif value == 4:
-                    self._current_operation = HVACMode.AUTO
-                else:
-                    self._current_operation = HVACMode.OFF
-                    self._preset = PRESET_NONE
-                self.schedule_update_ha_state()
-            except KeyError:
-                _LOGGER.error(
-                    "No variable 'hc_mode' in received code data %s",
-                    str(call.data),
+                self._preset = PRESET_FROST
+            elif value == 2:
+                self._current_operation = (
+                    HVACMode.OFF if not self._auto else HVACMode.AUTO
                 )
-        elif "hc_auto" == call.data.get("name"):
-            try:
-                value = call.data["value"]
-                if value == 1:
-                    self._auto = False
-                else:  # value == 2
-                    self._auto = True
-                self.schedule_update_ha_state()
-            except KeyError:
-                _LOGGER.error(
-                    "No variable 'hc_auto' in received code data %s",
-                    str(call.data),
+                self._preset = PRESET_ECO
+            elif value == 3:
+                self._current_operation = (
+                    HVACMode.HEAT if not self._auto else HVACMode.AUTO
                 )
+                self._preset = PRESET_COMFORT
+            elif value == 4:
+                self._current_operation = HVACMode.AUTO
+            else:
+                self._current_operation = HVACMode.OFF
+                self._preset = PRESET_NONE
+        elif name == "hc_auto":
+            if value == 1:
+                self._auto = False
+            else:  # value == 2
+                self._auto = True
+
+    @callback
+    def _handle_values(self, changes):
+        """Handle changed values received by the ht3-daemon."""
+        for name in CLIMATE_VALUES:
+            if name in changes:
+                self._set_value(name, changes[name])
+        self.async_write_ha_state()
 
     @property
     def should_poll(self) -> bool:
@@ -335,4 +316,7 @@ class Ht3Climate(ClimateEntity):
         return {
             ATTR_CONNECTED: self.driver.connected(),
             ATTR_CLIENT_ID: self.driver.clientID(),
+            ATTR_QUEUE_DEPTH: self.driver.queue_depth(),
+            ATTR_WRITE_LATENCY: self.driver.write_latency,
+            ATTR_WRITE_RTT: self.driver.write_rtt,
         }
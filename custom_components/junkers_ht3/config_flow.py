@@ -52,9 +52,10 @@ class Ht3FlowHandler(ConfigFlow, domain=DOMAIN):
         errors = {}
 
         driver = Ht3Driver(user_input[CONF_HOST], port=user_input[CONF_PORT])
-
-        driver.connect()
-        if not driver.connected():
+        await driver.connect()
+        connected = driver.connected()
+        driver.stop()
+        if not connected:
             errors["base"] = "cannot_connect"
             return await self._show_setup_form(errors)
 
@@ -7,9 +7,11 @@ from homeassistant.const import (
 from homeassistant.components.sensor import SensorDeviceClass
 from homeassistant.components.binary_sensor import BinarySensorDeviceClass
 
+from .filters import ValueFilter
+
 DOMAIN = "junkers_ht3"
 KEY_GATEWAY = "ht3_gateway"
-EVENT = "ht3_event"
+KEY_MANAGER = "ht3_manager"
 
 MANUFACTURER = "Junkers"
 DEVICE_NAME = "Heatronic 3"
@@ -17,6 +19,8 @@ DEVICE_MODEL = "HT3 gateway"
 DEVICE_SW_VERSION = "v1.0"
 
 SERVICE_RECONNECT = "reconnect"
+SERVICE_DUMP_FRAMES = "dump_frames"
+ATTR_ENTRY_ID = "entry_id"
 
 BINARY_SENSOR_DICT = {
     "ch_burner_operation": ["Burner operation", "mdi:fire", ""],
@@ -27,49 +31,81 @@ BINARY_SENSOR_DICT = {
 
 BINARY_SENSOR_LIST = list(BINARY_SENSOR_DICT)
 
+# name, unit, icon, device class, publish filter (filters.ValueFilter or None)
 SENSOR_DICT = {
     "ch_Tflow_measured": [
         "CH Temp flow measured",
         TEMP_CELSIUS,
         "mdi:radiator",
         SensorDeviceClass.TEMPERATURE,
+        ValueFilter(deadband=0.5, min_interval=10, heartbeat=300),
     ],
     "ch_burner_power": [
         "CH Burner power",
         PERCENTAGE,
         "mdi:gauge",
         SensorDeviceClass.POWER_FACTOR,
+        ValueFilter(deadband=2, min_interval=10, heartbeat=300),
     ],
     "ch_Tflow_desired": [
         "CH Temp flow desired",
         TEMP_CELSIUS,
         "mdi:radiator",
         SensorDeviceClass.TEMPERATURE,
+        None,
     ],
     "hc_Tdesired": [
         "HC Temp desired",
         TEMP_CELSIUS,
         "mdi:home-thermometer",
         SensorDeviceClass.TEMPERATURE,
+        None,
     ],
     "hc_Tmeasured": [
         "HC Temp measured",
         TEMP_CELSIUS,
         "mdi:home-thermometer",
         SensorDeviceClass.TEMPERATURE,
+        ValueFilter(deadband=0.2, min_interval=30, heartbeat=600),
     ],
     "dhw_Tdesired": [
         "DHW Temp desired",
         TEMP_CELSIUS,
         "mdi:shower",
         SensorDeviceClass.TEMPERATURE,
+        None,
     ],
     "dhw_Tmeasured": [
         "DHW Temp measured",
         TEMP_CELSIUS,
         "mdi:shower",
         SensorDeviceClass.TEMPERATURE,
+        ValueFilter(deadband=0.5, min_interval=10, heartbeat=300),
     ],
 }
 
 SENSOR_LIST = list(SENSOR_DICT)
+
+# driver metrics, exposed as diagnostic sensors disabled by default
+# name, unit, icon, scale applied to the metric value
+METRIC_DICT = {
+    "bytes_received": ["Bytes received", "B", "mdi:download-network", 1],
+    "frames_ch1": ["Frames heater", None, "mdi:counter", 1],
+    "frames_hc": ["Frames heating circuit", None, "mdi:counter", 1],
+    "frames_dhw": ["Frames hot water", None, "mdi:counter", 1],
+    "frames_solar": ["Frames solar", None, "mdi:counter", 1],
+    "frames_dt": ["Frames date/time", None, "mdi:counter", 1],
+    "frames_unknown": ["Frames of other types", None, "mdi:counter", 1],
+    "crc_errors": ["CRC errors", None, "mdi:alert-circle-outline", 1],
+    "bytes_skipped": ["Bytes skipped", "B", "mdi:alert-circle-outline", 1],
+    "buffer_high_water": ["Buffer high-water mark", "B", "mdi:tray-full", 1],
+    "decode_time_p95": ["Decode time p95", "µs", "mdi:timer-outline", 1e6],
+    "callback_time_p95": ["Callback time p95", "µs", "mdi:timer-outline", 1e6],
+    "ack_rtt_p50": ["Write round trip p50", "s", "mdi:timer-outline", 1],
+    "connects": ["Connects", None, "mdi:lan-connect", 1],
+    "disconnects": ["Disconnects", None, "mdi:lan-disconnect", 1],
+    "connect_failures": ["Connect failures", None, "mdi:lan-pending", 1],
+    "queue_depth": ["Write queue depth", None, "mdi:tray-full", 1],
+}
+
+METRIC_LIST = list(METRIC_DICT)
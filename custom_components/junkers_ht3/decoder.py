@@ -0,0 +1,300 @@
+"""Table driven decoders for Heatronic 3 messages"""
+from collections import namedtuple
+import struct
+
+# name:    value name reported to the callback
+# offset:  byte offset of the raw field in the frame
+# width:   raw field width in bytes (big endian)
+# scale:   divisor applied to the raw value
+# bitmask: bits of the raw field forming the value, shifted down to bit 0
+Field = namedtuple("Field", "name offset width scale bitmask")
+
+# signature:  leading bytes of the frame, the telegram header (source,
+#             destination, type, offset) and for EMS+ telegrams (type 0xff)
+#             the extended type
+# length:     total frame length: header, data, CRC and trailing byte
+# message:    MessageDecoder of the frame
+# kind:       frame type for the per type frame counters
+Decoder = namedtuple("Decoder", "signature length message kind")
+
+_FORMATS = {1: "B", 2: "H", 3: "BH", 4: "I"}
+
+
+class MessageDecoder:
+    """Decoder compiled from a table of fields.
+
+    All raw fields of a message are read with a single precompiled
+    `struct.Struct` unpack; fields sharing the same bytes (e.g. the bits
+    of a status byte) share one raw value. `post` may turn the decoded
+    (name, value) pairs into derived values.
+
+    `select()` compiles a decoder of only some of the fields, reading only
+    the bytes these depend on.
+    """
+
+    def __init__(self, fields, post=None, outputs=None):
+        self.fields = tuple(Field(*field) for field in fields)
+        self.post = post
+        # names of the values returned, `post` may replace the field names
+        self.outputs = frozenset(
+            outputs if outputs is not None else (field.name for field in self.fields)
+        )
+        self._derived = outputs is not None
+        self._selected = {}
+
+        layout = sorted({(field.offset, field.width) for field in self.fields})
+        fmt = ">"
+        pos = 0
+        index = {}
+        items = 0
+        wide = []
+        for offset, width in layout:
+            if offset < pos:
+                raise ValueError(
+                    "overlapping fields at offset {} in message table".format(offset)
+                )
+            fmt += "x" * (offset - pos) + _FORMATS[width]
+            index[(offset, width)] = items
+            if width == 3:
+                wide.append(items)
+                items += 2
+            else:
+                items += 1
+            pos = offset + width
+
+        self._struct = struct.Struct(fmt)
+        self._wide = tuple(wide)
+        self._ops = tuple(
+            (
+                field.name,
+                index[(field.offset, field.width)],
+                field.bitmask or 0,
+                _shift(field.bitmask),
+                field.scale,
+            )
+            for field in self.fields
+        )
+
+    @property
+    def size(self):
+        """Minimum frame length covered by the fields."""
+        return self._struct.size
+
+    def select(self, names):
+        """Decoder of the values `names` only, None if there are none.
+
+        Values derived by `post` from several fields need all of them, the
+        decoder itself is returned then.
+        """
+        names = self.outputs.intersection(names)
+        if not names:
+            return None
+        if self._derived or names == self.outputs:
+            return self
+        selected = self._selected.get(names)
+        if selected is None:
+            selected = self._selected[names] = MessageDecoder(
+                [field for field in self.fields if field.name in names], self.post
+            )
+        return selected
+
+    def decode(self, frame):
+        """Return the list of (name, value) pairs of a frame."""
+        raw = self._struct.unpack_from(frame)
+        if self._wide:
+            raw = list(raw)
+            for i in self._wide:
+                raw[i] = raw[i] << 16 | raw[i + 1]
+
+        values = []
+        for name, i, mask, shift, scale in self._ops:
+            value = raw[i]
+            if mask:
+                value = (value & mask) >> shift
+            if scale != 1:
+                value = value / scale
+            values.append((name, value))
+
+        if self.post is not None:
+            return self.post(values)
+        return values
+
+
+def _shift(bitmask):
+    """Position of the lowest set bit of a mask."""
+    if not bitmask:
+        return 0
+    return (bitmask & -bitmask).bit_length() - 1
+
+
+class DecoderRegistry:
+    """Message decoders by frame signature.
+
+    Decoders register against the signature of their frame; the driver
+    derives the frames to scan for and its dispatch table from the
+    registry, with one dict access per frame.
+    """
+
+    def __init__(self, decoders=()):
+        self._decoders = {}
+        for entry in decoders:
+            self.register(*entry)
+
+    def __iter__(self):
+        return iter(self._decoders.values())
+
+    def __len__(self):
+        return len(self._decoders)
+
+    def register(self, signature, length, message, kind):
+        """Add the decoder of the frames starting with `signature`"""
+        signature = bytes(signature)
+        if signature in self._decoders:
+            raise ValueError("frame {} already registered".format(signature.hex()))
+        if length < message.size + 2:
+            raise ValueError(
+                "frame {} too short for its fields".format(signature.hex())
+            )
+        self._decoders[signature] = Decoder(signature, length, message, kind)
+
+    def lengths(self):
+        """Frame length per signature, for the FrameScanner"""
+        return {entry.signature: entry.length for entry in self._decoders.values()}
+
+
+def _ht3_time(values):
+    """Format the date / time fields."""
+    year, month, hours, day, minute, sec = (value for _, value in values)
+    return [
+        (
+            "ht3_time",
+            "{:4d}-{:02d}-{:02d} {:02d}:{:02d}:{:02d}".format(
+                2000 + year, month, day, hours, minute, sec
+            ),
+        )
+    ]
+
+
+# heater
+CH1 = MessageDecoder(
+    [
+        ("ch_Tflow_desired", 4, 1, 1, None),
+        ("ch_Tflow_measured", 5, 2, 10, None),
+        # ("ch_Treturn", 17, 2, 10, None),
+        ("ch_Tmixer", 13, 2, 10, None),
+        ("ch_burner_power", 8, 1, 1, None),
+        ("ch_burner_operation", 9, 1, 1, 0x08),
+        ("ch_pump_heating", 11, 1, 1, 0x20),
+        ("ch_pump_cylinder", 11, 1, 1, 0x40),
+        ("ch_pump_circulation", 11, 1, 1, 0x80),
+        ("ch_burner_fan", 11, 1, 1, 0x01),
+        ("ch_mode", 9, 1, 1, 0x03),
+        ("ch_code", 24, 2, 1, None),
+        ("ch_22_num", 22, 1, 1, None),
+        ("ch_23_num", 23, 1, 1, None),
+    ]
+)
+
+
+def _hc(prefix):
+    """Decoder of the controller data of one heating circuit."""
+    return MessageDecoder(
+        [
+            (prefix + "_Tdesired", 8, 2, 10, None),
+            (prefix + "_Tmeasured", 10, 2, 10, None),
+            (prefix + "_mode", 6, 1, 1, None),
+            (prefix + "_auto", 7, 1, 1, None),
+        ]
+    )
+
+
+# controller data (FW1xy / FW2xy) per heating circuit, hc1 keeps the
+# value names from before the circuits were told apart
+HC1 = _hc("hc")
+HC2 = _hc("hc2")
+HC3 = _hc("hc3")
+HC4 = _hc("hc4")
+HC = HC1
+
+# domestic hot water data
+DHW = MessageDecoder(
+    [
+        ("dhw_Tdesired", 4, 1, 1, None),
+        ("dhw_Tmeasured", 5, 2, 10, None),
+        ("dhw_Tcylinder", 7, 2, 10, None),
+        ("ch_runtime_dhw", 14, 3, 1, None),
+        ("ch_starts_dhw", 17, 3, 1, None),
+        ("dhw_charge_once", 9, 1, 1, 0x02),
+        ("dhw_thermal_desinfection", 9, 1, 1, 0x04),
+        ("dhw_generating", 9, 1, 1, 0x08),
+        ("dhw_boost_charge", 9, 1, 1, 0x10),
+        ("dhw_Tok", 9, 1, 1, 0x20),
+    ]
+)
+
+
+def _solar(values):
+    """Collector temperatures below 0 are sent as two's complement."""
+    return [
+        (
+            (name, round(value - 6553.6, 1))
+            if name == "sol_Tcollector" and value > 3276.7
+            else (name, value)
+        )
+        for name, value in values
+    ]
+
+
+# solar module (ISM1) status
+SOLAR = MessageDecoder(
+    [
+        ("sol_yield_last_hour", 8, 2, 1, None),
+        ("sol_Tcollector", 10, 2, 10, None),
+        ("sol_Tcylinder_bottom", 12, 2, 10, None),
+        ("sol_pump", 14, 1, 1, 0x01),
+        ("sol_collector_shutdown", 15, 1, 1, 0x01),
+        ("sol_cylinder_heated", 15, 1, 1, 0x04),
+        ("sol_runtime", 16, 3, 1, None),
+    ],
+    post=_solar,
+)
+
+# date / time data
+DT = MessageDecoder(
+    [
+        ("year", 4, 1, 1, None),
+        ("month", 5, 1, 1, None),
+        ("hours", 6, 1, 1, None),
+        ("day", 7, 1, 1, None),
+        ("minute", 8, 1, 1, None),
+        ("sec", 9, 1, 1, None),
+        # ("dow", 10, 1, 1, None),
+        # ("dst", 11, 1, 1, 0x01),
+    ],
+    post=_ht3_time,
+    outputs=("ht3_time",),
+)
+
+FRAME_CH1 = b"\x88\x00\x18\x00"  # heater
+FRAME_HC1 = b"\x90\x00\xff\x00\x00\x6f"  # controller data (FW1xy / FW2xy)
+FRAME_HC2 = b"\x90\x00\xff\x00\x00\x70"
+FRAME_HC3 = b"\x90\x00\xff\x00\x00\x72"
+FRAME_HC4 = b"\x90\x00\xff\x00\x00\x74"
+FRAME_HC = FRAME_HC1
+FRAME_DHW = b"\x88\x00\x34\x00"  # domestic hot water data
+FRAME_SOLAR = b"\xb0\x00\xff\x00\x00\x03"  # solar module data
+FRAME_DT = b"\x90\x00\x06\x00"  # date / time data
+
+# the built-in decoders
+REGISTRY = DecoderRegistry(
+    [
+        (FRAME_CH1, 31, CH1, "ch1"),
+        (FRAME_HC1, 14, HC1, "hc"),
+        (FRAME_HC2, 14, HC2, "hc"),
+        (FRAME_HC3, 14, HC3, "hc"),
+        (FRAME_HC4, 14, HC4, "hc"),
+        (FRAME_DHW, 23, DHW, "dhw"),
+        (FRAME_SOLAR, 21, SOLAR, "solar"),
+        (FRAME_DT, 14, DT, "dt"),
+    ]
+)
@@ -1,306 +1,232 @@
 """Heatronic 3 driver"""
+import asyncio
 import logging
+import random
 import socket
-import threading
 import time
 
+from .capture import FRAME_LOG_SIZE, CaptureWriter, FrameLog, replay as replay_capture
+from .crc import crc_calc, crc_check
+from .decoder import REGISTRY
+from .metrics import Metrics
+from .scanner import FrameScanner
+
 _LOGGER = logging.getLogger(__name__)
 
-crc_table = [
-    0x00,
-    0x02,
-    0x04,
-    0x06,
-    0x08,
-    0x0A,
-    0x0C,
-    0x0E,
-    0x10,
-    0x12,
-    0x14,
-    0x16,
-    0x18,
-    0x1A,
-    0x1C,
-    0x1E,
-    0x20,
-    0x22,
-    0x24,
-    0x26,
-    0x28,
-    0x2A,
-    0x2C,
-    0x2E,
-    0x30,
-    0x32,
-    0x34,
-    0x36,
-    0x38,
-    0x3A,
-    0x3C,
-    0x3E,
-    0x40,
-    0x42,
-    0x44,
-    0x46,
-    0x48,
-    0x4A,
-    0x4C,
-    0x4E,
-    0x50,
-    0x52,
-    0x54,
-    0x56,
-    0x58,
-    0x5A,
-    0x5C,
-    0x5E,
-    0x60,
-    0x62,
-    0x64,
-    0x66,
-    0x68,
-    0x6A,
-    0x6C,
-    0x6E,
-    0x70,
-    0x72,
-    0x74,
-    0x76,
-    0x78,
-    0x7A,
-    0x7C,
-    0x7E,
-    0x80,
-    0x82,
-    0x84,
-    0x86,
-    0x88,
-    0x8A,
-    0x8C,
-    0x8E,
-    0x90,
-    0x92,
-    0x94,
-    0x96,
-    0x98,
-    0x9A,
-    0x9C,
-    0x9E,
-    0xA0,
-    0xA2,
-    0xA4,
-    0xA6,
-    0xA8,
-    0xAA,
-    0xAC,
-    0xAE,
-    0xB0,
-    0xB2,
-    0xB4,
-    0xB6,
-    0xB8,
-    0xBA,
-    0xBC,
-    0xBE,
-    0xC0,
-    0xC2,
-    0xC4,
-    0xC6,
-    0xC8,
-    0xCA,
-    0xCC,
-    0xCE,
-    0xD0,
-    0xD2,
-    0xD4,
-    0xD6,
-    0xD8,
-    0xDA,
-    0xDC,
-    0xDE,
-    0xE0,
-    0xE2,
-    0xE4,
-    0xE6,
-    0xE8,
-    0xEA,
-    0xEC,
-    0xEE,
-    0xF0,
-    0xF2,
-    0xF4,
-    0xF6,
-    0xF8,
-    0xFA,
-    0xFC,
-    0xFE,
-    0x19,
-    0x1B,
-    0x1D,
-    0x1F,
-    0x11,
-    0x13,
-    0x15,
-    0x17,
-    0x09,
-    0x0B,
-    0x0D,
-    0x0F,
-    0x01,
-    0x03,
-    0x05,
-    0x07,
-    0x39,
-    0x3B,
-    0x3D,
-    0x3F,
-    0x31,
-    0x33,
-    0x35,
-    0x37,
-    0x29,
-    0x2B,
-    0x2D,
-    0x2F,
-    0x21,
-    0x23,
-    0x25,
-    0x27,
-    0x59,
-    0x5B,
-    0x5D,
-    0x5F,
-    0x51,
-    0x53,
-    0x55,
-    0x57,
-    0x49,
-    0x4B,
-    0x4D,
-    0x4F,
-    0x41,
-    0x43,
-    0x45,
-    0x47,
-    0x79,
-    0x7B,
-    0x7D,
-    0x7F,
-    0x71,
-    0x73,
-    0x75,
-    0x77,
-    0x69,
-    0x6B,
-    0x6D,
-    0x6F,
-    0x61,
-    0x63,
-    0x65,
-    0x67,
-    0x99,
-    0x9B,
-    0x9D,
-    0x9F,
-    0x91,
-    0x93,
-    0x95,
-    0x97,
-    0x89,
-    0x8B,
-    0x8D,
-    0x8F,
-    0x81,
-    0x83,
-    0x85,
-    0x87,
-    0xB9,
-    0xBB,
-    0xBD,
-    0xBF,
-    0xB1,
-    0xB3,
-    0xB5,
-    0xB7,
-    0xA9,
-    0xAB,
-    0xAD,
-    0xAF,
-    0xA1,
-    0xA3,
-    0xA5,
-    0xA7,
-    0xD9,
-    0xDB,
-    0xDD,
-    0xDF,
-    0xD1,
-    0xD3,
-    0xD5,
-    0xD7,
-    0xC9,
-    0xCB,
-    0xCD,
-    0xCF,
-    0xC1,
-    0xC3,
-    0xC5,
-    0xC7,
-    0xF9,
-    0xFB,
-    0xFD,
-    0xFF,
-    0xF1,
-    0xF3,
-    0xF5,
-    0xF7,
-    0xE9,
-    0xEB,
-    0xED,
-    0xEF,
-    0xE1,
-    0xE3,
-    0xE5,
-    0xE7,
-]
-
-
-class Ht3Driver(threading.Thread):
+READ_SIZE = 1024
+RECV_TIMEOUT = 5.0
+# a proxy not taking 11 bytes for this long is gone
+WRITE_TIMEOUT = 5.0
+WRITE_BLOCK_GAP = 1.0
+RECONNECT_MIN = 0.5
+RECONNECT_MAX = 60.0
+RECONNECT_STABLE = 60.0
+ACK_TIMEOUT = 30.0
+ACK_RETRIES = 2
+ACK_RTT_BUCKETS = (0.5, 1, 2, 5, 10, 20, 30, 60)
+# seconds, for the time spent per received chunk and per notification
+TIME_BUCKETS = (1e-5, 2e-5, 5e-5, 1e-4, 2e-4, 5e-4, 1e-3, 2e-3, 5e-3, 0.01, 0.1)
+
+_MISSING = object()
+
+# total frame length in bytes of the built-in decoders: header, data, CRC
+# and trailing byte
+FRAME_LENGTH = REGISTRY.lengths()
+
+
+class ReconnectPolicy:
+    """Exponential backoff with jitter for reconnecting to the proxy.
+
+    The first attempt after a connection loss is immediate. Every failed
+    attempt doubles the delay up to `maximum`; the delay is drawn from the
+    upper half of the interval so many drivers do not retry in lockstep. A
+    connection that lasted at least `stable` seconds resets the backoff, a
+    flapping one keeps it.
+    """
+
+    def __init__(
+        self, minimum=RECONNECT_MIN, maximum=RECONNECT_MAX, stable=RECONNECT_STABLE
+    ):
+        self.minimum = minimum
+        self.maximum = maximum
+        self.stable = stable
+        self.attempts = 0
+
+    def next_delay(self):
+        """Seconds to wait before the next connection attempt."""
+        attempts = self.attempts
+        self.attempts += 1
+        if attempts == 0:
+            return 0
+        # the exponent is bounded, a proxy may stay down for days
+        delay = min(self.maximum, self.minimum * 2 ** min(attempts - 1, 32))
+        return random.uniform(delay / 2, delay)
+
+    def connection_lost(self, duration):
+        """Account for a lost connection that lasted `duration` seconds."""
+        if duration >= self.stable:
+            self.attempts = 0
+
+
+class Ht3Driver:
     """Heatronic 3 driver"""
 
-    def __init__(self, address, port=8088):
-        threading.Thread.__init__(self)
-        self.daemon = True
-        self._stop_thread = threading.Event()
-        self._lock = threading.Lock()
-
+    def __init__(
+        self,
+        address,
+        port=8088,
+        coalesce=0,
+        ack_timeout=ACK_TIMEOUT,
+        ack_retries=ACK_RETRIES,
+        frame_log_size=FRAME_LOG_SIZE,
+        registry=REGISTRY,
+    ):
         self._address = address
         self._port = int(port)
-        self._socket = None
+        self._reader = None
+        self._writer = None
+        self._task = None
+        self._command_task = None
         self._devicetype = "RX"
-        self._flag_writing_sequence = 0
-        self._buffer = ""
+        # the last raw frames with their outcome, for diagnostics
+        self.frame_log = FrameLog(frame_log_size)
+        self._registry = registry
+        self._scanner = FrameScanner(
+            registry.lengths(), validate=crc_check, log=self.frame_log.add
+        )
+        # signature -> (frame counter, decode function or None), see _dispatch()
+        self._dispatch_table = None
         self._client_id = 0
         self._stop = False
+        # cancelled tasks not finished yet, see join()
+        self._ending = set()
 
         self._connected = False
+        # counts connections, a command is sent on one connection only
+        self._session = 0
+        self._online = asyncio.Event()
+        self._reconnect = ReconnectPolicy()
+
+        # connection state changes
+        self.connects = 0
+        self.disconnects = 0
+        self.connect_failures = 0
+        self.last_outage = None
+        self._state_since = time.monotonic()
+
+        # pending write sequences per command, the latest value wins
+        self._commands = {}
+        self._command_queued = asyncio.Event()
+        self.write_latency = None
+
+        # sent commands waiting for their value to show up on the bus
+        self._acks = {}
+        self._ack_timeout = ack_timeout
+        self._ack_retries = ack_retries
+        self.write_rtt = None
+
+        # bus health and driver cost, see metrics() for the snapshot
+        self._metrics = Metrics()
+        self._counters = self._metrics.counters
+        self._metrics.counter("bytes_received")
+        for entry in registry:
+            self._metrics.counter("frames_" + entry.kind)
+        scanner = self._scanner
+        self._metrics.gauge("crc_errors", lambda: scanner.rejected)
+        self._metrics.gauge("bytes_skipped", lambda: scanner.skipped)
+        self._metrics.gauge("frames_unknown", lambda: scanner.unknown)
+        self._metrics.gauge("buffer_high_water", lambda: scanner.high_water)
+        self._metrics.gauge("connects", lambda: self.connects)
+        self._metrics.gauge("disconnects", lambda: self.disconnects)
+        self._metrics.gauge("connect_failures", lambda: self.connect_failures)
+        self._metrics.gauge("queue_depth", self.queue_depth)
+        self.ack_rtt = self._metrics.histogram("ack_rtt", ACK_RTT_BUCKETS)
+        self.decode_time = self._metrics.histogram("decode_time", TIME_BUCKETS)
+        self.callback_time = self._metrics.histogram("callback_time", TIME_BUCKETS)
+        self._callback_elapsed = 0.0
 
         self.dict = {}
         self.callback = None
+        self._subscribers = {}
+        self._coalesce = coalesce
+        self._filters = {}
+        self._published = {}
+        self._pending = {}
+        self._flush_handle = None
+        self._capture = None
 
         _LOGGER.info("HT3 cht_socket_client init")
 
-        # self.connect()
-
-    def __del__(self):
-        if self._socket is not None:
-            self._socket.close()
-            _LOGGER.info("Client-ID:%s; socket closed", self._client_id)
-
     def set_callback(self, function):
-        """Function to be called when data is changed."""
+        """Function to be called with a dict of all changed values of a frame.
+
+        With a callback set all frames are decoded, otherwise only those
+        with values subscribed to.
+        """
         self.callback = function
+        self._dispatch_table = None
+
+    def set_filters(self, filters):
+        """Set the publish filters (ValueFilter) per value name."""
+        self._filters = dict(filters)
+        self._published = {}
+
+    def subscribe(self, names, function):
+        """Call function(changes) when one of the values `names` changes.
+
+        `changes` is a dict with the changed values of `names`; all changes of
+        one frame (or of one coalescing window) are delivered in one call.
+        Returns a function removing the subscription again.
+        """
+        names = tuple(names)
+        # tuples are replaced, never changed, so dispatch can iterate safely
+        for name in names:
+            self._subscribers[name] = self._subscribers.get(name, ()) + (function,)
+        self._dispatch_table = None
+
+        def unsubscribe():
+            for name in names:
+                functions = tuple(
+                    other
+                    for other in self._subscribers.get(name, ())
+                    if other != function
+                )
+                if functions:
+                    self._subscribers[name] = functions
+                else:
+                    self._subscribers.pop(name, None)
+            self._dispatch_table = None
+
+        return unsubscribe
+
+    def start_capture(self, path):
+        """Append all received raw data to the capture file `path`"""
+        self.stop_capture()
+        self._capture = CaptureWriter(path)
+        _LOGGER.info("Client-ID:%s; capturing to %s", self._client_id, path)
+
+    def stop_capture(self):
+        """Close the capture file, join() waits until it is written"""
+        if self._capture is not None:
+            closed = self._capture.close()
+            if not closed.done():
+                self._ending.add(closed)
+                closed.add_done_callback(self._ending.discard)
+            _LOGGER.info(
+                "Client-ID:%s; captured %d bytes to %s",
+                self._client_id,
+                self._capture.bytes,
+                self._capture.path,
+            )
+            self._capture = None
+
+    async def replay(self, path, speed=1.0):
+        """Feed a capture file through the parser instead of the socket.
+
+        `speed` 1.0 replays in real time, 0 as fast as possible. Returns the
+        number of replayed chunks.
+        """
+        return await replay_capture(path, self._handle_messages, speed)
 
     def connected(self):
         """Check if driver is connected"""
@@ -310,216 +236,493 @@ class Ht3Driver(threading.Thread):
         """get Client ID"""
         return self._client_id
 
+    def queue_depth(self):
+        """Number of write commands waiting to be sent"""
+        return len(self._commands)
+
+    def metrics(self):
+        """Snapshot of the driver metrics (counters, gauges, histograms)"""
+        return self._metrics.snapshot()
+
+    def diagnostics(self):
+        """Connection state, metrics, values and the frame log"""
+        return {
+            "connected": self._connected,
+            "client_id": self._client_id,
+            "metrics": self.metrics(),
+            "values": dict(self.dict),
+            "frames_logged": self.frame_log.count,
+            "frames": self.frame_log.entries(),
+        }
+
+    def start(self):
+        """Start the receive and command tasks on the running event loop"""
+        loop = asyncio.get_running_loop()
+        self._stop = False
+        if self._task is None or self._task.done():
+            self._task = loop.create_task(self.run())
+        if self._command_task is None or self._command_task.done():
+            self._command_task = loop.create_task(self._send_commands())
+        return self._task
+
     def stop(self):
-        """Stop the interface connection"""
-        self._stop = True
-        # self._stop_thread.set()
+        """Stop the interface connection.
 
-        if self._socket is not None:
-            with self._lock:  # Receive thread might use the socket
-                self._connected = False
-                self._socket.close()
-                self._socket = None
-                _LOGGER.info("Client-ID:%s; socket closed", self._client_id)
+        Closes the socket and cancels the receive task at once, a pending
+        read or reconnect delay included; nothing runs until restart().
+        Pending commands are kept and sent after the restart.
+        """
+        self._stop = True
+        if self._flush_handle is not None:
+            self._flush_handle.cancel()
+            self._flush()
+        self._end_task(self._task)
+        self._task = None
+        self._close()
+        self.stop_capture()
+
+    def cancel(self):
+        """Stop the interface connection and end the tasks of the driver"""
+        self.stop()
+        self._end_task(self._command_task)
+        self._command_task = None
+        # no retries once the driver is cancelled
+        for _, _, _, handle in self._acks.values():
+            handle.cancel()
+        if self._acks:
+            self._acks.clear()
+            self._dispatch_table = None
 
     def restart(self):
         """Restart the interface connection"""
-        self._stop = False
+        self.start()
+
+    async def join(self, timeout=1.0):
+        """Wait until the tasks cancelled by stop() or cancel() have ended"""
+        if self._ending:
+            await asyncio.wait(set(self._ending), timeout=timeout)
+
+    async def async_stop(self, timeout=1.0):
+        """Cancel the driver and wait for its tasks to end"""
+        self.cancel()
+        await self.join(timeout)
+
+    def _end_task(self, task):
+        if task is not None and not task.done():
+            task.cancel()
+            self._ending.add(task)
+            task.add_done_callback(self._ending.discard)
+
+    def _close(self):
+        if self._connected:
+            now = time.monotonic()
+            self._reconnect.connection_lost(now - self._state_since)
+            self._state_since = now
+            self.disconnects += 1
+        self._connected = False
+        self._online.clear()
+        if self._writer is not None:
+            self._writer.close()
+            self._writer = None
+            self._reader = None
+            _LOGGER.info("Client-ID:%s; socket closed", self._client_id)
 
-    def _write(self, data):
-        """write data to connected socket. It will block
-        until all data is written.
+    def _connection_lost(self, operation):
+        """close the connection after a failed read or write.
+
+        Both directions end up here, the receive loop then reconnects once.
         """
-        if self._socket is None:
-            _LOGGER.critical(
-                "Client-ID:%s; cht_socket_client._write(); socket not initialised",
+        if self._connected:
+            _LOGGER.warning(
+                "Client-ID:%s; cht_socket_client; error on socket %s",
                 self._client_id,
+                operation,
             )
+        self._close()
 
-        try:
-            self._socket.sendall(bytes(data))
-        except:
-            self._connected = False
-            self._socket.close()
-            self._socket = None
+    async def _write(self, data):
+        """write data to connected socket, waits only while the proxy stalls.
+
+        The transport sends at once, next to a pending read; `data` must not
+        change afterwards as the transport may keep it until sent.
+        """
+        writer = self._writer
+        if writer is None:
             _LOGGER.critical(
-                "Client-ID:%s; cht_socket_client._write(); error on socket.sendall",
+                "Client-ID:%s; cht_socket_client._write(); socket not initialised",
                 self._client_id,
             )
-            raise
-
-    def _read(self):
-        data = self._socket.recv(1024)
-        # print (data)
-        # print (data.hex())
-        return data.hex()
-
-    def _substr(self, string, start, end):
-        return string[start : start + end]
-
-    def _set_value(self, name, value):
-        if name in self.dict:
-            old_value = self.dict[name]
-            if value != old_value:
-                self.dict[name] = value
-                if self.callback:
-                    self.callback(name, value)
-        else:
-            self.dict[name] = value
-            if self.callback:
-                self.callback(name, value)
+            raise ConnectionError("not connected")
 
-    def connect(self):
+        try:
+            writer.write(data)
+            await asyncio.wait_for(writer.drain(), WRITE_TIMEOUT)
+        except (OSError, asyncio.TimeoutError) as error:
+            # the connection may have been replaced while draining
+            if writer is self._writer:
+                self._connection_lost("write")
+            raise ConnectionError("write failed") from error
+
+    async def _read(self):
+        """receive the next chunk of the stream"""
+        data = await asyncio.wait_for(self._reader.read(READ_SIZE), RECV_TIMEOUT)
+        if not data:
+            raise ConnectionResetError("connection closed by proxy")
+        return data
+
+    @staticmethod
+    def _hex(data):
+        """hex representation of received bytes, for debug logging only"""
+        return bytes(data).hex()
+
+    def _set_values(self, values):
+        """Store decoded (name, value) pairs and notify the changed ones."""
+        current = self.dict
+        filters = self._filters
+        changes = {}
+        now = None
+        if self._acks:
+            self._check_acks(values)
+        for name, value in values:
+            value_filter = filters.get(name)
+            if value_filter is None:
+                if current.get(name, _MISSING) != value:
+                    current[name] = value
+                    changes[name] = value
+                continue
+
+            # filtered values are compared with the last published value, so a
+            # held back change is published with one of the next frames
+            current[name] = value
+            if now is None:
+                now = time.monotonic()
+            published = self._published.get(name)
+            if published is None or value_filter.accept(
+                value, published[0], now - published[1]
+            ):
+                self._published[name] = (value, now)
+                changes[name] = value
+        if changes:
+            if self._coalesce:
+                self._pending.update(changes)
+                if self._flush_handle is None:
+                    self._flush_handle = asyncio.get_running_loop().call_later(
+                        self._coalesce, self._flush
+                    )
+            else:
+                self._notify(changes)
+
+    def _flush(self):
+        """Deliver the changes collected in the coalescing window."""
+        self._flush_handle = None
+        if self._pending:
+            changes = self._pending
+            self._pending = {}
+            self._notify(changes)
+
+    def _notify(self, changes):
+        subscribers = self._subscribers
+        calls = {}
+        for name, value in changes.items():
+            for function in subscribers.get(name, ()):
+                if function in calls:
+                    calls[function][name] = value
+                else:
+                    calls[function] = {name: value}
+        if not calls and self.callback is None:
+            return
+        start = time.perf_counter()
+        for function, values in calls.items():
+            function(values)
+        if self.callback:
+            self.callback(changes)
+        elapsed = time.perf_counter() - start
+        self.callback_time.observe(elapsed)
+        self._callback_elapsed += elapsed
+
+    async def connect(self):
         """connect to HT3 gateway"""
         try:
-            self._socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-            self._socket.settimeout(5.0)
-            self._socket.connect((self._address, self._port))
-            self._socket.setsockopt(socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1)
+            self._reader, self._writer = await asyncio.wait_for(
+                asyncio.open_connection(self._address, self._port), RECV_TIMEOUT
+            )
+            sock = self._writer.get_extra_info("socket")
+            if sock is not None:
+                sock.setsockopt(socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1)
+                # netcom blocks are tiny, send them without waiting for acks
+                sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
             _LOGGER.info(
                 "Connected to server:'%s';port:'%d'", self._address, self._port
             )
-        except (socket.error, socket.timeout, ValueError):
-            _LOGGER.critical(
+        except (OSError, asyncio.TimeoutError, ValueError):
+            _LOGGER.debug(
                 "HT3 cht_socket_client.connect();error:can't connect to socket %s:%s",
                 self._address,
                 self._port,
             )
             self._connected = False
-            self._socket = None
-            # raise
+            self._reader = self._writer = None
             return False
 
         # send registration to proxy-server and receive client-related informations from server
         try:
             # send devicetype to server
-            devicetype = bytearray(self._devicetype.encode("utf-8"))
-            self._write(devicetype)
+            await self._write(self._devicetype.encode("utf-8"))
 
             # read answer from server (client-ID) and store it
-            self._client_id = self._socket.recv(10).decode("utf-8")
-            ## only for test## print("client got ID:{0}".format(self._client_id))
-        except (socket.error, socket.timeout, ValueError):
-            self._socket.close()
-            self._socket = None
-            _LOGGER.critical(
+            client_id = await asyncio.wait_for(self._reader.read(10), RECV_TIMEOUT)
+            self._client_id = client_id.decode("utf-8")
+        except (OSError, asyncio.TimeoutError, ValueError):
+            self._close()
+            _LOGGER.debug(
                 "HT3 cht_socket_client.connect();error:can't register to master"
             )
-            self._connected = False
             return False
-            # raise
 
         # successfully connected to server
+        self._scanner.reset()
         _LOGGER.info(
             "Client-ID:%s; registered with devicetype:'%s'",
             self._client_id,
             self._devicetype,
         )
+        now = time.monotonic()
+        if self.connects:
+            self.last_outage = now - self._state_since
+        self._state_since = now
+        self.connects += 1
+        self._session += 1
         self._connected = True
+        self._online.set()
 
         return True
 
-    def run(self):
-        # @ToDo: add connection lost + reconnect
-        # @ToDo: search for start-tag '#' and 'H','R'
+    def _dispatch(self):
+        """Frame counter and decode function per signature.
 
+        Only the values subscribed to, or awaited as the acknowledgement of
+        a command, are decoded; frames without any of them are only
+        counted. Rebuilt after the subscriptions changed, values no longer
+        decoded are dropped then.
+        """
+        table = self._dispatch_table
+        if table is not None:
+            return table
+
+        wanted = None
+        if self.callback is None:
+            wanted = self._subscribers.keys() | self._acks.keys()
+        table = self._dispatch_table = {}
+        decoded = set()
+        for entry in self._registry:
+            message = entry.message
+            if wanted is not None:
+                message = message.select(wanted)
+            if message is None:
+                table[entry.signature] = ("frames_" + entry.kind, None)
+            else:
+                table[entry.signature] = ("frames_" + entry.kind, message.decode)
+                decoded |= message.outputs
+        if wanted is not None:
+            for name in self.dict.keys() - decoded:
+                del self.dict[name]
+                self._published.pop(name, None)
+        return table
+
+    def _handle_messages(self, data):
+        start = time.perf_counter()
+        self._callback_elapsed = 0.0
+        counters = self._counters
+        counters["bytes_received"] += len(data)
+        self.frame_log.time = time.time()
+        dispatch = self._dispatch()
+        set_values = self._set_values
+        for signature, frame in self._scanner.feed(data):
+            counter, decode = dispatch[signature]
+            counters[counter] += 1
+            if decode is not None:
+                set_values(decode(frame))
+        # time spent in the callbacks is accounted for in callback_time
+        self.decode_time.observe(time.perf_counter() - start - self._callback_elapsed)
+
+    async def run(self):
+        """Receive loop, runs as task on the event loop until stopped"""
         _LOGGER.info("Client-ID:%s; cht_socket_client run", self._client_id)
 
-        def handle_messages(data):
-            self._buffer += data
-            if len(self._buffer) > 0:
-                if self._buffer.find("88000200") >= 0:  # heater
-                    pos = self._buffer.find("88002000")
-                    length = 62
-                    _data = self._substr(self._buffer, pos, length)
-                    if len(_data) >= length:
-                        print(_data)
-                elif self._buffer.find("88001800") >= 0:  # heater
-                    pos = self._buffer.find("88001800")
-                    length = 62
-                    _data = self._substr(self._buffer, pos, length)
-                    if len(_data) >= length:
-                        self._decode_msg_ch1(_data, length)
-                        self._buffer = ""
-                elif (
-                    self._buffer.find("9000ff00") >= 0
-                ):  # controller data (FW1xy / FW2xy)
-                    pos = self._buffer.find("9000ff00")
-                    length = 28
-                    _data = self._substr(self._buffer, pos, length)
-                    if len(_data) >= length:
-                        self._decode_msg_hc(_data, length)
-                        self._buffer = ""
-                elif self._buffer.find("88003400") >= 0:  # domestic hot water data
-                    pos = self._buffer.find("88003400")
-                    length = 46
-                    _data = self._substr(self._buffer, pos, length)
-                    if len(_data) >= length:
-                        self._decode_msg_dhw(_data, length)
-                        self._buffer = ""
-                elif self._buffer.find("90000600") >= 0:  # date / time data
-                    pos = self._buffer.find("90000600")
-                    length = 28
-                    _data = self._substr(self._buffer, pos, length)
-                    if len(_data) >= length:
-                        self._decode_msg_dt(_data, length)
-                        self._buffer = ""
-                elif self._buffer.find("#HR") >= 0:
-                    print(self._buffer[self._buffer.find("#HR") :])
-                # else:
-                #    print(self._buffer)
-
-        while not self._stop_thread.isSet():
-            if not self._stop:
+        try:
+            # the flag ends the loop even if a cancellation gets lost
+            while not self._stop:
                 if not self._connected:
-                    time.sleep(10)
-                    self.connect()
-                else:
-                    try:
-                        with self._lock:
-                            data = self._read()
-                        handle_messages(data)
-                    except (socket.timeout, ValueError):  # No data
-                        _LOGGER.critical(
-                            "Client-ID:%s; cht_socket_client.run(); error on socket.recv",
+                    await asyncio.sleep(self._reconnect.next_delay())
+                    if await self.connect():
+                        _LOGGER.info(
+                            "Client-ID:%s; connected to %s:%s after %d attempt(s)",
                             self._client_id,
+                            self._address,
+                            self._port,
+                            self._reconnect.attempts,
+                        )
+                    else:
+                        self.connect_failures += 1
+                        # once per outage, the proxy may be down for a while
+                        log = (
+                            _LOGGER.warning
+                            if self._reconnect.attempts == 1
+                            else _LOGGER.debug
+                        )
+                        log(
+                            "HT3 cht_socket_client.run();error:can't connect to %s:%s, retrying",
+                            self._address,
+                            self._port,
                         )
-                        self._connected = False
-                        self._socket.close()
-                        self._socket = None
+                else:
+                    try:
+                        data = await self._read()
+                        if self._capture is not None:
+                            self._capture.write(data)
+                        self._handle_messages(data)
+                    except (OSError, asyncio.TimeoutError, ValueError):  # No data
+                        self._connection_lost("read")
+        except Exception:
+            _LOGGER.exception("Client-ID:%s; receive loop failed", self._client_id)
+        finally:
+            # a restart may have opened the next connection already
+            if self._task in (None, asyncio.current_task()):
+                self._close()
+            _LOGGER.info("Client-ID:%s; cht_socket_client stopped", self._client_id)
+
+    def _queue_command(self, command, blocks, expect, retries=0):
+        """Queue the netcom blocks of a command for the command task.
+
+        `expect` is the (name, value) pair acknowledging the command when it
+        is decoded from the bus. A command still waiting in the queue is
+        replaced by the new value and keeps its place, so only the latest
+        setpoint is sent.
+        """
+        if command in self._commands:
+            enqueued = self._commands[command][1]
+        else:
+            enqueued = time.monotonic()
+        # immutable, handed to the transport without a copy
+        blocks = tuple(bytes(block) for block in blocks)
+        self._commands[command] = (blocks, enqueued, expect, retries)
+        self._command_queued.set()
+
+    async def _send_commands(self):
+        """Send the queued commands one after another, runs as task"""
+        while True:
+            await self._command_queued.wait()
+            await self._online.wait()
+            if not self._commands:
+                self._command_queued.clear()
+                continue
+
+            command = next(iter(self._commands))
+            entry = self._commands.pop(command)
+            blocks, enqueued = entry[:2]
+            session = self._session
+            sent = time.monotonic()
+            try:
+                for block in blocks:
+                    if self._session != session:
+                        # reconnected between the blocks, send all of them again
+                        raise ConnectionError("connection replaced")
+                    await self._write(block)
+                    # give the transceiver time to put the block on the bus
+                    await asyncio.sleep(WRITE_BLOCK_GAP)
+            except OSError:
+                # keep the command unless a newer value was queued meanwhile
+                self._commands.setdefault(command, entry)
+                continue
+
+            self.write_latency = time.monotonic() - enqueued
+            _LOGGER.debug(
+                "Client-ID:%s; %s sent after %.2fs",
+                self._client_id,
+                command,
+                self.write_latency,
+            )
+            self._expect_ack(command, entry, sent)
+
+    def _expect_ack(self, command, entry, sent):
+        """Wait for the value of a sent command to be decoded from the bus"""
+        name = entry[2][0]
+        previous = self._acks.pop(name, None)
+        if previous is not None:
+            # superseded by this command
+            previous[3].cancel()
+        handle = asyncio.get_running_loop().call_later(
+            self._ack_timeout, self._ack_expired, name
+        )
+        self._acks[name] = (command, entry, sent, handle)
+        # decode the frame with the value until it is acknowledged
+        self._dispatch_table = None
+
+    def _check_acks(self, values):
+        acks = self._acks
+        for name, value in values:
+            ack = acks.get(name)
+            if ack is None:
+                continue
+            command, entry, sent, handle = ack
+            expected = entry[2][1]
+            try:
+                matched = abs(value - expected) < 0.05
+            except TypeError:
+                matched = value == expected
+            if matched:
+                del acks[name]
+                handle.cancel()
+                # stop decoding the value unless it is subscribed to
+                self._dispatch_table = None
+                self.write_rtt = time.monotonic() - sent
+                self.ack_rtt.observe(self.write_rtt)
+                _LOGGER.debug(
+                    "Client-ID:%s; %s acknowledged after %.2fs",
+                    self._client_id,
+                    command,
+                    self.write_rtt,
+                )
 
-        _LOGGER.info("Client-ID:%s; cht_socket_client stopped", self._client_id)
+    def _ack_expired(self, name):
+        command, entry, _, _ = self._acks.pop(name)
+        self._dispatch_table = None
+        blocks, _, expect, retries = entry
+        if command in self._commands:
+            # a newer value is already queued
+            return
+        if retries >= self._ack_retries:
+            _LOGGER.warning(
+                "Client-ID:%s; %s not acknowledged by the bus after %d retries",
+                self._client_id,
+                command,
+                retries,
+            )
+            return
+        _LOGGER.info(
+            "Client-ID:%s; %s not acknowledged, retrying", self._client_id, command
+        )
+        self._queue_command(command, blocks, expect, retries + 1)
 
     def write_hc_trequested(self, trequested):
-        # do not write if flag is set
-        if self._flag_writing_sequence == 1:
-            return False
-        self._flag_writing_sequence = 1
-
+        """Queue a new requested room temperature"""
         trequested_4htbus = int(trequested * 2)
 
-        ## send 1. netcom-bytes to 'ht_pitiny' | 'ht_piduino' (ht_transceiver)
+        ## 1. netcom-bytes to 'ht_pitiny' | 'ht_piduino' (ht_transceiver)
         #   header=  '#',   <length>  ,'!' ,'S' ,0x11
         #   header= 0x23,(len(data)+3),0x21,0x53,0x11
         #   data  = 0x10,0xff,0x11,0x00,0x65,tsoll
         #   block=header+data
-        header = [0x23, 0x09, 0x21, 0x53, 0x11]
-        data = [0x10, 0xFF, 0x11, 0x00, 0x65, trequested_4htbus]
-        block = header + data
-        self._write(block)
-
-        time.sleep(1)
-
-        ## send 2. netcom-bytes to 'ht_pitiny' | 'ht_piduino' (ht_transceiver)
-        #   header= 0x23,(len(data)+3),0x21,0x53,0x11
+        ## 2. netcom-bytes, one second later
         #   data  = 0x10,0xff,0x07,0x00,0x79,tsoll
-        #   block=header+data
         header = [0x23, 0x09, 0x21, 0x53, 0x11]
-        data = [0x10, 0xFF, 0x07, 0x00, 0x79, trequested_4htbus]
-        block = header + data
-        self._write(block)
-
-        self._flag_writing_sequence = 0
+        blocks = (
+            header + [0x10, 0xFF, 0x11, 0x00, 0x65, trequested_4htbus],
+            header + [0x10, 0xFF, 0x07, 0x00, 0x79, trequested_4htbus],
+        )
+        self._queue_command(
+            "hc_trequested", blocks, ("hc_Tdesired", trequested_4htbus / 2)
+        )
 
         _LOGGER.info(
             "Client-ID:%s; writeHC_Trequested:'%d'", self._client_id, trequested
@@ -531,189 +734,29 @@ class Ht3Driver(threading.Thread):
         return True
 
     def write_hc_mode(self, mode_requested):
-        # do not write if flag is set
-        if self._flag_writing_sequence == 1:
-            return False
-
-        self._flag_writing_sequence = 1
-
-        ## send 1. netcom-bytes to 'ht_pitiny' | 'ht_piduino' (ht_transceiver)
+        """Queue a new heating circuit mode"""
+        ## 1. netcom-bytes to 'ht_pitiny' | 'ht_piduino' (ht_transceiver)
         #   header=  '#',   <length>  ,'!' ,'S' ,0x11
         #   header= 0x23,(len(data)+3),0x21,0x53,0x11
         #   data  = 0x10,0xff,0x0e,0x00,0x65,mode_requested
         #   block=header+data
-        header = [0x23, 0x09, 0x21, 0x53, 0x11]
-        data = [0x10, 0xFF, 0x0E, 0x00, 0x65, mode_requested]
-        block = header + data
-        self._write(block)
-
-        time.sleep(1)
-
-        ## send 2. netcom-bytes to 'ht_pitiny' | 'ht_piduino' (ht_transceiver)
-        #   header= 0x23,(len(data)+3),0x21,0x53,0x11
+        ## 2. netcom-bytes, one second later
         #   data  = 0x10,0xff,0x04,0x00,0x79,mode_requested
-        #   block=header+data
         header = [0x23, 0x09, 0x21, 0x53, 0x11]
-        data = [0x10, 0xFF, 0x04, 0x00, 0x79, mode_requested]
-        block = header + data
-        self._write(block)
-
-        self._flag_writing_sequence = 0
+        blocks = (
+            header + [0x10, 0xFF, 0x0E, 0x00, 0x65, mode_requested],
+            header + [0x10, 0xFF, 0x04, 0x00, 0x79, mode_requested],
+        )
+        self._queue_command("hc_mode", blocks, ("hc_mode", mode_requested))
 
         _LOGGER.info("Client-ID:%s; writeHC_mode:'%d'", self._client_id, mode_requested)
 
         return True
 
-    def _decode_msg_ch1(self, string, length):
-        if self.crc_check(string, length):
-            self._set_value("ch_Tflow_desired", int(self._substr(string, 4 * 2, 2), 16))
-            self._set_value(
-                "ch_Tflow_measured", int(self._substr(string, 5 * 2, 4), 16) / 10
-            )
-            # self.ch_Treturn          = int(self._substr(string,17*2,4), 16)/10
-            self._set_value("ch_Tmixer", int(self._substr(string, 13 * 2, 4), 16) / 10)
-            self._set_value("ch_burner_power", int(self._substr(string, 8 * 2, 2), 16))
-            self._set_value(
-                "ch_burner_operation",
-                1 if (int(self._substr(string, 9 * 2, 2), 16) & 0x08) else 0,
-            )
-            self._set_value(
-                "ch_pump_heating",
-                1 if (int(self._substr(string, 11 * 2, 2), 16) & 0x20) else 0,
-            )
-            self._set_value(
-                "ch_pump_cylinder",
-                1 if (int(self._substr(string, 11 * 2, 2), 16) & 0x40) else 0,
-            )
-            self._set_value(
-                "ch_pump_circulation",
-                1 if (int(self._substr(string, 11 * 2, 2), 16) & 0x80) else 0,
-            )
-            self._set_value(
-                "ch_burner_fan",
-                1 if (int(self._substr(string, 11 * 2, 2), 16) & 0x01) else 0,
-            )
-            self._set_value("ch_mode", (int(self._substr(string, 9 * 2, 2), 16) & 0x03))
-            self._set_value("ch_code", int(self._substr(string, 24 * 2, 4), 16))
-            self._set_value("ch_22_num", int(self._substr(string, 22 * 2, 2), 16))
-            self._set_value("ch_23_num", int(self._substr(string, 23 * 2, 2), 16))
-            # self.ch_22_char          = (ch_22_num == 0) ? "0" : chr(ch_22_num)
-            # self.ch_23_char          = (ch_23_num == 0) ? "0" : chr(ch_23_num)
-            # self.ch_error            = ch_22_char . ch_23_char
-            # print(self.ch_Tflow_measured)
-
-    def _decode_msg_hc(self, string, length):
-        # prefix = "hc1_"
-
-        if self.crc_check(string, length):
-            # Messages of length 11 Bytes are unknown -> no handling
-            if length == 11:
-                return 1
-
-            # hc_type = int(self._substr(string, 5 * 2, 2), 16)
-
-            # if hc_type == 111:
-            #     prefix = "hc1_"
-            # elif hc_type == 112:
-            #     prefix = "hc2_"
-            # elif hc_type == 114:
-            #     prefix = "hc3_"
-            # elif hc_type == 116:
-            #     prefix = "hc4_"
-            # elif hc_type == 211:
-            #     return 1
-
-            if length != 9:
-                self._set_value(
-                    "hc_Tdesired", int(self._substr(string, 8 * 2, 4), 16) / 10
-                )
-                self._set_value(
-                    "hc_Tmeasured", int(self._substr(string, 10 * 2, 4), 16) / 10
-                )
-
-            self._set_value("hc_mode", int(self._substr(string, 6 * 2, 2), 16))
-            self._set_value("hc_auto", int(self._substr(string, 7 * 2, 2), 16))
-
-            # print("{0}: {1} - {2}".format(prefix, self.hc_Tdesired, self.hc_Tmeasured))
-
-    def _decode_msg_dhw(self, string, length):
-        if self.crc_check(string, length):
-            self._set_value("dhw_Tdesired", int(self._substr(string, 4 * 2, 2), 16))
-            self._set_value(
-                "dhw_Tmeasured", int(self._substr(string, 5 * 2, 4), 16) / 10
-            )
-            self._set_value(
-                "dhw_Tcylinder", int(self._substr(string, 7 * 2, 4), 16) / 10
-            )
-            self._set_value("ch_runtime_dhw", int(self._substr(string, 14 * 2, 6), 16))
-            self._set_value("ch_starts_dhw", int(self._substr(string, 17 * 2, 6), 16))
-            self._set_value(
-                "dhw_charge_once",
-                1 if (int(self._substr(string, 9 * 2, 2), 16) & 0x02) else 0,
-            )
-            self._set_value(
-                "dhw_thermal_desinfection",
-                1 if (int(self._substr(string, 9 * 2, 2), 16) & 0x04) else 0,
-            )
-            self._set_value(
-                "dhw_generating",
-                1 if (int(self._substr(string, 9 * 2, 2), 16) & 0x08) else 0,
-            )
-            self._set_value(
-                "dhw_boost_charge",
-                1 if (int(self._substr(string, 9 * 2, 2), 16) & 0x10) else 0,
-            )
-            self._set_value(
-                "dhw_Tok", 1 if (int(self._substr(string, 9 * 2, 2), 16) & 0x20) else 0
-            )
-
-            # print("DHW: {} {} {} {} {} {} {}".format(self.dhw_Tdesired, self.dhw_Tmeasured, self.ch_runtime_dhw, self.dhw_charge_once, self.dhw_generating, self.dhw_boost_charge, self.dhw_Tok))
-
-    def _decode_msg_dt(self, string, length):
-        if self.crc_check(string, length):
-            year = 2000 + int(self._substr(string, 4 * 2, 2), 16)
-            month = int(self._substr(string, 5 * 2, 2), 16)
-            day = int(self._substr(string, 7 * 2, 2), 16)
-            hours = int(self._substr(string, 6 * 2, 2), 16)
-            minute = int(self._substr(string, 8 * 2, 2), 16)
-            sec = int(self._substr(string, 9 * 2, 2), 16)
-            # dow = int(self._substr(string, 10 * 2, 2), 16)
-            # dst = "dst" if (int(self._substr(string, 11 * 2, 2), 16) & 0x01) else ""
-
-            self._set_value(
-                "ht3_time",
-                "{:4d}-{:02d}-{:02d} {:02d}:{:02d}:{:02d}".format(
-                    year, month, day, hours, minute, sec
-                ),
-            )
-            # print("{:4d}-{:02d}-{:02d} {:02d}:{:02d}:{:02d}".format(self.year, self.month, self.day, self.hours, self.min, self.sec))
-
     def crc_check(self, buffer, length):
         """calculate CRC checksum"""
-        if length < 6:
-            return False
-
-        length >>= 1
-        crc = 0
-
-        try:
-            for i in range(0, length - 2):
-                crc = crc_table[crc]
-                crc ^= int(self._substr(buffer, i * 2, 2), 16)
-
-            return crc == int(self._substr(buffer, length * 2 - 4, 2), 16)
-
-        except (IndexError):
-            # print("crc_check();Error;{0}", e.args[0])
-            return False
-
-    def crc_get(self, string):
-        """get CRC"""
-        crc = 0
-        length = int(len(string) / 2)
-
-        for i in range(length - 3):
-            crc = int(crc_table[crc])
-            crc ^= int(self._substr(string, i * 2, 2), 16)
+        return crc_check(buffer[:length])
 
-        # print (hex(crc), " ", self._substr(string, length*2-4, 2))
+    def crc_get(self, data):
+        """get CRC of a frame's header and data bytes"""
+        return crc_calc(data)
@@ -0,0 +1,47 @@
+"""Publish filters for Heatronic 3 values"""
+
+
+class ValueFilter:
+    """Decide whether a changed value is worth publishing.
+
+    deadband:     minimum absolute change against the last published value
+    relative:     minimum change relative to the last published value
+    min_interval: minimum seconds between two published values
+    heartbeat:    seconds after which the value is published again, changed
+                  or not, as a keep-alive
+
+    The thresholds only apply to numbers; other values are published on
+    every change, subject to `min_interval`. A change to or from 0, e.g. a
+    burner switching off, always passes the thresholds.
+    """
+
+    def __init__(self, deadband=0, relative=0, min_interval=0, heartbeat=0):
+        self.deadband = deadband
+        self.relative = relative
+        self.min_interval = min_interval
+        self.heartbeat = heartbeat
+
+    def __repr__(self):
+        return (
+            "ValueFilter(deadband={}, relative={}, min_interval={}, heartbeat={})"
+        ).format(self.deadband, self.relative, self.min_interval, self.heartbeat)
+
+    def accept(self, value, published, elapsed):
+        """Check a value against the last published one, `elapsed` seconds ago."""
+        if self.heartbeat and elapsed >= self.heartbeat:
+            return True
+        if value == published:
+            return False
+        if elapsed < self.min_interval:
+            return False
+        if value == 0 or published == 0:
+            return True
+        try:
+            delta = abs(value - published)
+        except TypeError:
+            return True
+        if delta < self.deadband:
+            return False
+        if delta < self.relative * abs(published):
+            return False
+        return True
@@ -0,0 +1,113 @@
+"""Connection manager for many Heatronic 3 gateways"""
+import asyncio
+import logging
+
+from .driver import Ht3Driver
+
+_LOGGER = logging.getLogger(__name__)
+
+
+class GatewayManager:
+    """All gateway drivers of an instance, multiplexed on one event loop.
+
+    Every proxy connection is an Ht3Driver with its own socket, parser,
+    values and subscribers, so gateways share nothing but the loop: a
+    silent or broken gateway only waits in its own tasks and costs the
+    others nothing.
+
+    Connections are reference counted per host and port: all consumers of
+    one proxy share a single socket, registration and parse, and subscribe
+    to the values they need on the shared driver. The last release closes
+    the connection. The config flow creates one entry per proxy; other
+    consumers of a proxy, e.g. tools next to its entry, use acquire().
+    """
+
+    def __init__(self):
+        self._connections = {}  # (host, port) -> [driver, references]
+        self._keys = {}  # consumer key -> (host, port)
+        self._started = False
+
+    def __len__(self):
+        return len(self._connections)
+
+    def __contains__(self, key):
+        return key in self._keys
+
+    @staticmethod
+    def _address(address, port):
+        return (address.lower(), int(port))
+
+    def acquire(self, address, port, **kwargs):
+        """Driver of the proxy at address:port, shared by all consumers.
+
+        `kwargs` are passed to the driver if this opens the connection.
+        """
+        key = self._address(address, port)
+        connection = self._connections.get(key)
+        if connection is None:
+            connection = self._connections[key] = [
+                Ht3Driver(address, port, **kwargs),
+                0,
+            ]
+            if self._started:
+                connection[0].start()
+            _LOGGER.debug("connection to %s:%s opened", address, port)
+        connection[1] += 1
+        return connection[0]
+
+    async def release(self, address, port, timeout=1.0):
+        """Drop one reference, the last one closes the connection"""
+        key = self._address(address, port)
+        connection = self._connections.get(key)
+        if connection is None:
+            return
+        connection[1] -= 1
+        if connection[1] <= 0:
+            del self._connections[key]
+            await connection[0].async_stop(timeout)
+            _LOGGER.debug("connection to %s:%s closed", address, port)
+
+    def add(self, key, address, port, **kwargs):
+        """Acquire the driver of a gateway for the consumer `key`"""
+        if key in self._keys:
+            raise ValueError("gateway {} already added".format(key))
+        driver = self.acquire(address, port, **kwargs)
+        self._keys[key] = (address, port)
+        return driver
+
+    def get(self, key):
+        """Driver of the consumer `key`"""
+        return self._connections[self._address(*self._keys[key])][0]
+
+    async def remove(self, key, timeout=1.0):
+        """Release the driver of the consumer `key`"""
+        address = self._keys.pop(key, None)
+        if address is not None:
+            await self.release(*address, timeout)
+
+    def start(self):
+        """Start all drivers on the running event loop"""
+        self._started = True
+        for driver, _ in self._connections.values():
+            driver.start()
+
+    async def stop(self, timeout=1.0):
+        """Stop all drivers and wait for their tasks to end"""
+        self._started = False
+        await asyncio.gather(
+            *(driver.async_stop(timeout) for driver, _ in self._connections.values())
+        )
+
+    def stats(self):
+        """Connection state per proxy, for diagnostics"""
+        return {
+            "{}:{}".format(*address): {
+                "references": references,
+                "connected": driver.connected(),
+                "connects": driver.connects,
+                "disconnects": driver.disconnects,
+                "connect_failures": driver.connect_failures,
+                "queue_depth": driver.queue_depth(),
+            }
+            for address, (driver, references) in self._connections.items()
+        }
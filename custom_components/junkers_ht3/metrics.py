@@ -0,0 +1,78 @@
+"""Lightweight metrics for the Heatronic 3 driver"""
+from bisect import bisect_left
+
+
+class Histogram:
+    """Fixed bucket histogram.
+
+    `buckets` are the upper bounds of the buckets in ascending order; values
+    above the last bound are counted in an extra overflow bucket.
+    """
+
+    def __init__(self, buckets):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value):
+        """Count one value."""
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+
+    def quantile(self, fraction):
+        """Upper bound of the bucket holding the given fraction of values."""
+        if not self.count:
+            return None
+        rank = fraction * self.count
+        seen = 0
+        for bound, count in zip(self.buckets, self.counts):
+            seen += count
+            if seen >= rank:
+                return bound
+        return float("inf")
+
+    def as_dict(self):
+        """Snapshot for attributes and diagnostics."""
+        buckets = {str(bound): count for bound, count in zip(self.buckets, self.counts)}
+        buckets["+Inf"] = self.counts[-1]
+        return {"count": self.count, "sum": round(self.sum, 6), "buckets": buckets}
+
+
+class Metrics:
+    """Registry of the counters, gauges and histograms of one driver.
+
+    Counters are plain dict entries, bumped on the hot path with
+    `metrics.counters[name] += 1`. Gauges are functions read only when a
+    snapshot is taken, so values the driver keeps anyway cost nothing.
+    """
+
+    def __init__(self):
+        self.counters = {}
+        self.gauges = {}
+        self.histograms = {}
+
+    def counter(self, name):
+        """Register a counter starting at 0."""
+        self.counters.setdefault(name, 0)
+
+    def gauge(self, name, function):
+        """Register a gauge read by calling `function()`."""
+        self.gauges[name] = function
+
+    def histogram(self, name, buckets):
+        """Register and return a histogram."""
+        histogram = self.histograms[name] = Histogram(buckets)
+        return histogram
+
+    def snapshot(self):
+        """Flat name -> value dict; histograms as count, p50 and p95."""
+        values = dict(self.counters)
+        for name, function in self.gauges.items():
+            values[name] = function()
+        for name, histogram in self.histograms.items():
+            values[name + "_count"] = histogram.count
+            values[name + "_p50"] = histogram.quantile(0.5)
+            values[name + "_p95"] = histogram.quantile(0.95)
+        return values
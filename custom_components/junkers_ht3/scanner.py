@@ -0,0 +1,255 @@
+"""Incremental frame scanner for the Heatronic 3 byte stream"""
+import re
+
+from .crc import CRC_TABLE
+
+# Upper bound of bytes kept between two chunks. Complete frames are consumed
+# as soon as they arrive, so only a partial frame is ever pending.
+MAX_PENDING = 1024
+
+# telegram length bounds: source, destination, type and offset, up to 25
+# data bytes, CRC and the break byte
+MIN_TELEGRAM = 6
+MAX_TELEGRAM = 32
+TELEGRAM_HEADER = 4
+# lengths of unknown telegram types remembered, garbage may add a few
+MAX_LEARNED = 256
+
+# outcome of the bytes passed to `log`
+FRAME_OK = "ok"
+FRAME_CRC = "crc"  # rejected by `validate`, the CRC check in the driver
+FRAME_UNKNOWN = "unknown"  # skipped bytes: garbage or frames of other types
+
+
+class FrameScanner:
+    """Split the received byte stream into frames.
+
+    `frames` maps each frame signature (the leading bytes of the frame) to
+    the total frame length. Every received byte is looked at once: the read
+    cursor only moves forward, consumed bytes are dropped after each chunk
+    and bytes between known frames are skipped. A frame rejected by
+    `validate` only skips its first byte, so a signature seen inside garbage
+    cannot swallow the real frame that follows it.
+
+    Once a frame was accepted the scanner is in step with the telegrams on
+    the bus: the next telegram starts right behind it. A telegram of an
+    unknown type is then skipped as a whole, up to the break byte after its
+    CRC, so its data is never misread as the signature of a known frame.
+    The length found is kept per header (source, destination, type and
+    offset) and checked against the CRC of the next telegram of that type.
+    A span is never skipped while a known frame starting inside it passes
+    `validate`, so garbage that happens to end like a telegram cannot hide
+    a frame. Bytes that do not form a telegram drop back to searching for
+    the next signature.
+
+    `log(data, outcome)` is called, in stream order, with every accepted
+    frame, every frame rejected by `validate` and every span of skipped
+    bytes.
+    """
+
+    def __init__(self, frames, validate=None, max_pending=MAX_PENDING, log=None):
+        self._frames = dict(frames)
+        self._validate = validate
+        self._log = log
+        self._max_pending = max_pending
+        self._keep = max(len(signature) for signature in self._frames) - 1
+        self._prefixes = {
+            signature[:i]
+            for signature in self._frames
+            for i in range(1, len(signature))
+        }
+        self._pattern = re.compile(
+            b"|".join(re.escape(signature) for signature in self._frames)
+        )
+        self._buffer = bytearray()
+        # the buffer starts at a telegram boundary
+        self._synced = False
+        self._learned = {}  # header -> length of unknown telegrams
+        self.skipped = 0
+        self.unknown = 0
+        self.rejected = 0
+        self.high_water = 0
+
+    def reset(self):
+        """Drop all pending bytes, e.g. after a reconnect."""
+        self._buffer.clear()
+        self._synced = False
+
+    @property
+    def pending(self):
+        """Number of bytes waiting for the rest of a frame."""
+        return len(self._buffer)
+
+    def feed(self, data):
+        """Append received bytes and return the completed (signature, frame) pairs."""
+        buffer = self._buffer
+        buffer += data
+        if len(buffer) > self.high_water:
+            self.high_water = len(buffer)
+        match_at = self._pattern.match
+        search = self._pattern.search
+        frames = self._frames
+        validate = self._validate
+        log = self._log
+        result = []
+        pos = 0
+        end = len(buffer)
+        synced = self._synced
+        learned = self._learned
+
+        while True:
+            match = None
+            if synced:
+                match = match_at(buffer, pos)
+                if match is None:
+                    header = bytes(buffer[pos : pos + TELEGRAM_HEADER])
+                    telegram = learned.get(header)
+                    if telegram is not None:
+                        telegram += pos
+                        if telegram > end or not _telegram_valid(buffer, pos, telegram):
+                            telegram = None
+                    if telegram is None:
+                        telegram = _telegram_end(buffer, pos, end)
+                        if telegram and (
+                            header in learned or len(learned) < MAX_LEARNED
+                        ):
+                            learned[header] = telegram - pos
+                    if telegram == 0:
+                        # wait for the rest unless a frame shows up behind it
+                        if not self._valid_frame(buffer, pos + 1, end):
+                            start = pos
+                            break
+                    elif telegram is not None:
+                        # garbage may end like a telegram: never skip a
+                        # valid frame, wait until one inside is complete
+                        inner = self._frame_inside(buffer, pos + 1, telegram, end)
+                        if inner is None:
+                            start = pos
+                            break
+                        if not inner:
+                            self.unknown += 1
+                            self.skipped += telegram - pos
+                            if log is not None:
+                                log(bytes(buffer[pos:telegram]), FRAME_UNKNOWN)
+                            pos = telegram
+                            continue
+                    synced = False
+
+            if match is None:
+                match = search(buffer, pos)
+                if match is None:
+                    # keep a possible signature prefix at the end of the chunk
+                    start = max(pos, end - self._keep)
+                    break
+
+            start = match.start()
+            signature = match.group()
+            length = frames[signature]
+            if start + length > end:
+                # frame not complete yet, wait for the next chunk
+                break
+
+            frame = bytes(buffer[start : start + length])
+            if validate is None or validate(frame):
+                result.append((signature, frame))
+                if start > pos:
+                    self.skipped += start - pos
+                    if log is not None:
+                        log(bytes(buffer[pos:start]), FRAME_UNKNOWN)
+                if log is not None:
+                    log(frame, FRAME_OK)
+                pos = start + length
+                synced = True
+            else:
+                synced = False
+                self.rejected += 1
+                self.skipped += start + 1 - pos
+                if log is not None:
+                    if start > pos:
+                        log(bytes(buffer[pos:start]), FRAME_UNKNOWN)
+                    log(frame, FRAME_CRC)
+                pos = start + 1
+
+        if start > pos:
+            self.skipped += start - pos
+            if log is not None:
+                log(bytes(buffer[pos:start]), FRAME_UNKNOWN)
+            pos = start
+        if pos:
+            del buffer[:pos]
+        if len(buffer) > self._max_pending:
+            overflow = len(buffer) - self._max_pending
+            self.skipped += overflow
+            if log is not None:
+                log(bytes(buffer[:overflow]), FRAME_UNKNOWN)
+            del buffer[:overflow]
+            synced = False
+        self._synced = synced
+
+        return result
+
+    def _frame_inside(self, buffer, pos, stop, end):
+        """Check for a frame passing `validate` starting in buffer[pos:stop].
+
+        Returns None if that is not known before more bytes arrive.
+        """
+        search = self._pattern.search
+        limit = min(end, stop + self._keep)
+        match = search(buffer, pos, limit)
+        while match is not None and match.start() < stop:
+            start = match.start()
+            length = self._frames[match.group()]
+            if start + length > end:
+                return None
+            if self._validate is None or self._validate(
+                bytes(buffer[start : start + length])
+            ):
+                return True
+            match = search(buffer, start + 1, limit)
+        # a signature cut off by the end of the received bytes
+        for start in range(max(pos, end - self._keep), min(stop, end)):
+            if bytes(buffer[start:end]) in self._prefixes:
+                return None
+        return False
+
+    def _valid_frame(self, buffer, pos, end):
+        """Check for a complete frame passing `validate` in buffer[pos:end]."""
+        search = self._pattern.search
+        match = search(buffer, pos, end)
+        while match is not None:
+            start = match.start()
+            stop = start + self._frames[match.group()]
+            if stop <= end and (
+                self._validate is None or self._validate(bytes(buffer[start:stop]))
+            ):
+                return True
+            match = search(buffer, start + 1, end)
+        return False
+
+
+def _telegram_valid(buffer, pos, stop):
+    """Check the CRC and break byte of the telegram in buffer[pos:stop]."""
+    if buffer[stop - 1]:
+        return False
+    table = CRC_TABLE
+    crc = 0
+    for i in range(pos, stop - 2):
+        crc = table[crc] ^ buffer[i]
+    return crc == buffer[stop - 2]
+
+
+def _telegram_end(buffer, pos, end):
+    """End of the telegram at `pos`, behind the break byte after its CRC.
+
+    Returns 0 if more bytes are needed, None if the bytes are no telegram.
+    """
+    table = CRC_TABLE
+    crc = 0
+    last = min(end, pos + MAX_TELEGRAM) - 1
+    first = pos + MIN_TELEGRAM - 2
+    for i in range(pos, last):
+        byte = buffer[i]
+        if byte == crc and i >= first and not buffer[i + 1]:
+            return i + 2
+        crc = table[crc] ^ byte
+    return 0 if end < pos + MAX_TELEGRAM else None
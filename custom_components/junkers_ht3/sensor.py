@@ -1,25 +1,28 @@
 """Support for sensors."""
+from datetime import timedelta
 import logging
+import math
 
 # import voluptuous as vol
 
 # from homeassistant.components.sensor import PLATFORM_SCHEMA, DEVICE_CLASSES_SCHEMA
 # from homeassistant.const import CONF_RESOURCE, CONF_NAME, CONF_UNIT_OF_MEASUREMENT, CONF_DEVICE_CLASS, DEVICE_CLASS_TEMPERATURE, CONF_TYPE, CONF_ICON
 from homeassistant.helpers.entity import Entity
-from homeassistant.helpers.entity import DeviceInfo
+from homeassistant.helpers.entity import DeviceInfo, EntityCategory
 from homeassistant.config_entries import ConfigEntry
 from homeassistant.helpers.entity_platform import AddEntitiesCallback
-from homeassistant.core import HomeAssistant
-
+from homeassistant.core import HomeAssistant, callback
 
 # import homeassistant.helpers.config_validation as cv
 
 from .const import (
     SENSOR_DICT,
     SENSOR_LIST,
+    METRIC_DICT,
+    METRIC_LIST,
     MANUFACTURER,
     DOMAIN,
-    EVENT,
+    KEY_GATEWAY,
     DEVICE_NAME,
     DEVICE_MODEL,
     DEVICE_SW_VERSION,
@@ -27,6 +30,9 @@ from .const import (
 
 _LOGGER = logging.getLogger(__name__)
 
+# polling interval of the metric sensors, value sensors are pushed
+SCAN_INTERVAL = timedelta(seconds=60)
+
 # PLATFORM_SCHEMA = PLATFORM_SCHEMA.extend(
 #    {
 #        vol.Required(CONF_RESOURCE): cv.string,
@@ -53,27 +59,34 @@ async def async_setup_entry(
     async_add_entities: AddEntitiesCallback,
 ) -> None:
     """Set up the HT3 sensor."""
+    driver = hass.data[KEY_GATEWAY][config_entry.entry_id]
     sensors = [
         Ht3Sensor(
             hass=hass,
+            driver=driver,
             resource=sensor_name,
             entry_id=config_entry.entry_id,
         )
         for sensor_name in SENSOR_LIST
     ]
+    sensors += [
+        Ht3MetricSensor(driver=driver, metric=metric, entry_id=config_entry.entry_id)
+        for metric in METRIC_LIST
+    ]
     async_add_entities(sensors, True)
 
 
 class Ht3Sensor(Entity):
     """Representation of a Sensor."""
 
-    def __init__(self, hass, resource, entry_id):
+    def __init__(self, hass, driver, resource, entry_id):
         """Initialize the sensor."""
         variable_info = SENSOR_DICT[resource]
         self._state = None
         self._name = variable_info[0] if variable_info[0] else resource
         self._resource = resource
         self._entry_id = entry_id
+        self._driver = driver
 
         self._unit_of_measurement = variable_info[1]
         self._device_class = variable_info[3]
@@ -81,12 +94,10 @@ class Ht3Sensor(Entity):
 
         self._available = False
 
-        hass.bus.async_listen(EVENT, self._handle_code)
-
     @property
     def unique_id(self) -> str:
         """Return a unique ID."""
-        return f"{self._resource}"
+        return f"{self._entry_id}/{self._resource}"
 
     @property
     def icon(self) -> str:
@@ -138,24 +149,87 @@ class Ht3Sensor(Entity):
         """Return True if entity is available."""
         return self._available
 
-    def _handle_code(self, call):
-        """Handle received code by the ht3-daemon.
-        If the code matches the defined payload
-        of this sensor the sensor state is changed accordingly.
-        """
-        # Check if received code matches defined payload
-        # True if payload is contained in received code dict, not
-        # all items have to match
-        if self._resource == call.data.get("name"):
-            try:
-                value = call.data["value"]
-                self._state = value
-                self._available = True
-                self.async_schedule_update_ha_state(False)
-            except KeyError:
-                _LOGGER.error(
-                    "No variable %s in received code data %s",
-                    str(self._resource),
-                    str(call.data),
-                )
-                self._available = False
+    async def async_added_to_hass(self) -> None:
+        """Subscribe to value changes of the ht3-daemon."""
+        if self._resource in self._driver.dict:
+            self._set_state(self._driver.dict[self._resource])
+        self.async_on_remove(
+            self._driver.subscribe((self._resource,), self._handle_values)
+        )
+
+    def _set_state(self, value):
+        self._state = value
+        self._available = True
+
+    @callback
+    def _handle_values(self, changes):
+        """Handle a changed value of this sensor received by the ht3-daemon."""
+        self._set_state(changes[self._resource])
+        self.async_write_ha_state()
+
+
+class Ht3MetricSensor(Entity):
+    """Diagnostic sensor showing one metric of the driver."""
+
+    _attr_entity_category = EntityCategory.DIAGNOSTIC
+    _attr_entity_registry_enabled_default = False
+
+    def __init__(self, driver, metric, entry_id):
+        """Initialize the sensor."""
+        variable_info = METRIC_DICT[metric]
+        self._driver = driver
+        self._metric = metric
+        self._entry_id = entry_id
+        self._state = None
+
+        self._name = variable_info[0]
+        self._unit_of_measurement = variable_info[1]
+        self._icon = variable_info[2]
+        self._scale = variable_info[3]
+
+    @property
+    def unique_id(self) -> str:
+        """Return a unique ID."""
+        return f"{self._entry_id}/{self._metric}"
+
+    @property
+    def name(self) -> str:
+        """Return the name of the sensor."""
+        return self._name
+
+    @property
+    def icon(self) -> str:
+        """Icon to use in the frontend, if any."""
+        return self._icon
+
+    @property
+    def unit_of_measurement(self) -> str:
+        """Return the unit this state is expressed in."""
+        return self._unit_of_measurement
+
+    @property
+    def device_info(self) -> DeviceInfo:
+        """Return the device information of the entity."""
+        return {
+            "identifiers": {(DOMAIN, self._entry_id)},
+            "name": DEVICE_NAME,
+            "manufacturer": MANUFACTURER,
+            "model": DEVICE_MODEL,
+            "sw_version": DEVICE_SW_VERSION,
+        }
+
+    @property
+    def state(self):
+        """Return the state of the entity."""
+        return self._state
+
+    async def async_update(self):
+        """Take the metric from a snapshot of the driver metrics."""
+        value = self._driver.metrics().get(self._metric)
+        if value is None or not math.isfinite(value):
+            # no samples yet, or beyond the last histogram bucket
+            self._state = None
+        elif self._scale != 1:
+            self._state = round(value * self._scale, 1)
+        else:
+            self._state = value
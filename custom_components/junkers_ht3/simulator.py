@@ -0,0 +1,350 @@
+"""Stand-in for the hometop_HT3 proxy, for testing without hardware"""
+import argparse
+import asyncio
+import logging
+import random
+import struct
+import threading
+import time
+
+from .crc import crc_append
+from .decoder import FRAME_CH1, FRAME_DHW, FRAME_DT, FRAME_HC
+
+_LOGGER = logging.getLogger(__name__)
+
+# pause after sending the client ID, so it is not read together with frames
+HANDSHAKE_GAP = 0.05
+# frames written at once when running as fast as possible
+BURST = 100
+
+# netcom write block: '#', length, '!', 'S', 0x11, data
+WRITE_START = 0x23
+
+# register byte of a write block -> simulated value
+WRITE_TARGETS = {
+    0x11: "hc_Tdesired",
+    0x07: "hc_Tdesired",
+    0x0E: "hc_mode",
+    0x04: "hc_mode",
+}
+
+
+class BusState:
+    """Values reported by the synthetic frames, wandering a little per frame."""
+
+    def __init__(self, rng):
+        self._rng = rng
+        self.ch_Tflow_desired = 55
+        self.ch_Tflow_measured = 50.0
+        self.ch_Tmixer = 40.0
+        self.ch_burner_power = 30
+        self.ch_status = 0x0B
+        self.ch_pumps = 0x21
+        self.hc_Tdesired = 21.0
+        self.hc_Tmeasured = 20.5
+        self.hc_mode = 3
+        self.hc_auto = 2
+        self.dhw_Tdesired = 50
+        self.dhw_Tmeasured = 48.0
+        self.dhw_Tcylinder = 47.0
+        self.ch_runtime_dhw = 12000
+        self.ch_starts_dhw = 3400
+
+    def _walk(self, value, step, low, high):
+        return min(high, max(low, value + self._rng.uniform(-step, step)))
+
+    def frame(self, signature):
+        """Next frame with the given signature, including CRC and trailer."""
+        rng = self._rng
+        if signature == FRAME_CH1:
+            self.ch_Tflow_measured = self._walk(self.ch_Tflow_measured, 0.3, 20, 80)
+            self.ch_Tmixer = self._walk(self.ch_Tmixer, 0.2, 20, 60)
+            self.ch_burner_power = int(self._walk(self.ch_burner_power, 2, 0, 100))
+            data = struct.pack(
+                ">BHxBBxBxH7xBBH3x",
+                self.ch_Tflow_desired,
+                round(self.ch_Tflow_measured * 10),
+                self.ch_burner_power,
+                self.ch_status,
+                self.ch_pumps,
+                round(self.ch_Tmixer * 10),
+                0,
+                0,
+                0,
+            )
+        elif signature == FRAME_HC:
+            self.hc_Tmeasured = self._walk(self.hc_Tmeasured, 0.05, 15, 25)
+            data = struct.pack(
+                ">BBHH",
+                self.hc_mode,
+                self.hc_auto,
+                round(self.hc_Tdesired * 10),
+                round(self.hc_Tmeasured * 10),
+            )
+        elif signature == FRAME_DHW:
+            self.dhw_Tmeasured = self._walk(self.dhw_Tmeasured, 0.3, 30, 60)
+            self.dhw_Tcylinder = self._walk(self.dhw_Tcylinder, 0.1, 30, 60)
+            if rng.random() < 0.01:
+                self.ch_starts_dhw += 1
+            data = struct.pack(
+                ">BHHB4xBHBHx",
+                self.dhw_Tdesired,
+                round(self.dhw_Tmeasured * 10),
+                round(self.dhw_Tcylinder * 10),
+                0x20,
+                self.ch_runtime_dhw >> 16,
+                self.ch_runtime_dhw & 0xFFFF,
+                self.ch_starts_dhw >> 16,
+                self.ch_starts_dhw & 0xFFFF,
+            )
+        elif signature == FRAME_DT:
+            now = time.localtime()
+            data = bytes(
+                (
+                    now.tm_year - 2000,
+                    now.tm_mon,
+                    now.tm_hour,
+                    now.tm_mday,
+                    now.tm_min,
+                    now.tm_sec,
+                    now.tm_wday,
+                    now.tm_isdst > 0,
+                )
+            )
+        else:
+            raise ValueError("unknown frame {}".format(signature.hex()))
+        return crc_append(signature + data)
+
+    def apply(self, block):
+        """Take over the value written by a netcom write block."""
+        if len(block) < 11:
+            return
+        name = WRITE_TARGETS.get(block[7])
+        if name == "hc_Tdesired":
+            self.hc_Tdesired = block[10] / 2
+        elif name == "hc_mode":
+            self.hc_mode = block[10]
+
+
+class ProxySimulator:
+    """Asyncio TCP server speaking the hometop_HT3 proxy protocol.
+
+    Every client registers with its device type and gets a client ID, then
+    receives a stream of ch1, hc, dhw and date/time frames with valid CRCs
+    at `rate` frames per second (0: as fast as the client reads). Write
+    blocks sent by a client are logged, kept in `writes` and applied to the
+    simulated values, so the written value shows up in the next hc frame.
+
+    Faults:
+    garbage:    probability of random bytes before a frame
+    fragment:   split the stream into writes of at most this many bytes
+    disconnect: probability of dropping the client after a frame
+    """
+
+    def __init__(
+        self,
+        host="127.0.0.1",
+        port=8088,
+        rate=10.0,
+        garbage=0.0,
+        fragment=0,
+        disconnect=0.0,
+        seed=None,
+    ):
+        self.host = host
+        self.port = port
+        self.rate = rate
+        self.garbage = garbage
+        self.fragment = fragment
+        self.disconnect = disconnect
+        self._rng = random.Random(seed)
+        self.state = BusState(self._rng)
+        self._server = None
+        self._clients = set()
+        self._next_id = 1
+
+        self.writes = []
+        self.frames_sent = 0
+        self.bytes_sent = 0
+        self.disconnects = 0
+
+    async def start(self):
+        """Start listening, returns the bound port"""
+        self._server = await asyncio.start_server(
+            self._handle_client, self.host, self.port
+        )
+        self.port = self._server.sockets[0].getsockname()[1]
+        _LOGGER.info("simulator listening on %s:%d", self.host, self.port)
+        return self.port
+
+    async def stop(self):
+        """Stop listening and drop all clients"""
+        if self._server is not None:
+            self._server.close()
+            self.drop_clients()
+            await self._server.wait_closed()
+            self._server = None
+
+    def drop_clients(self):
+        """Disconnect all clients, as on a proxy restart"""
+        for writer in tuple(self._clients):
+            writer.close()
+
+    def _frames(self):
+        signatures = (FRAME_CH1, FRAME_HC, FRAME_DHW, FRAME_DT)
+        while True:
+            for signature in signatures:
+                yield self.state.frame(signature)
+
+    async def _handle_client(self, reader, writer):
+        client_id = self._next_id
+        self._next_id += 1
+        self._clients.add(writer)
+        reading = None
+        try:
+            devicetype = await reader.read(2)
+            if not devicetype:
+                return
+            writer.write(str(client_id).encode("utf-8"))
+            await writer.drain()
+            _LOGGER.info(
+                "client %d registered with devicetype:'%s'",
+                client_id,
+                devicetype.decode("utf-8", "replace"),
+            )
+            await asyncio.sleep(HANDSHAKE_GAP)
+
+            reading = asyncio.get_running_loop().create_task(
+                self._read_writes(client_id, reader)
+            )
+            await self._stream(writer, reading)
+        except (OSError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            if reading is not None:
+                reading.cancel()
+            self._clients.discard(writer)
+            writer.close()
+            _LOGGER.info("client %d disconnected", client_id)
+
+    async def _stream(self, writer, reading):
+        rng = self._rng
+        frames = self._frames()
+        start = time.monotonic()
+        sent = 0
+        # the client closing its end ends the read task
+        while not reading.done() and not writer.is_closing():
+            if self.rate:
+                due = int((time.monotonic() - start) * self.rate) - sent
+                if due <= 0:
+                    await asyncio.sleep(1 / self.rate)
+                    continue
+            else:
+                due = BURST
+
+            chunk = bytearray()
+            for _ in range(due):
+                if self.garbage and rng.random() < self.garbage:
+                    chunk += rng.randbytes(rng.randint(1, 16))
+                chunk += next(frames)
+                sent += 1
+                if self.disconnect and rng.random() < self.disconnect:
+                    await self._send(writer, chunk)
+                    self.disconnects += 1
+                    return
+            await self._send(writer, chunk)
+            self.frames_sent += due
+            if not self.rate:
+                await asyncio.sleep(0)
+
+    async def _send(self, writer, chunk):
+        if self.fragment:
+            rng = self._rng
+            pos = 0
+            while pos < len(chunk):
+                size = rng.randint(1, self.fragment)
+                writer.write(chunk[pos : pos + size])
+                await writer.drain()
+                pos += size
+        else:
+            writer.write(chunk)
+            await writer.drain()
+        self.bytes_sent += len(chunk)
+
+    async def _read_writes(self, client_id, reader):
+        buffer = bytearray()
+        while True:
+            data = await reader.read(1024)
+            if not data:
+                return
+            buffer += data
+            while True:
+                start = buffer.find(WRITE_START)
+                if start < 0:
+                    buffer.clear()
+                    break
+                if len(buffer) < start + 2:
+                    break
+                end = start + buffer[start + 1] + 2
+                if len(buffer) < end:
+                    break
+                block = bytes(buffer[start:end])
+                del buffer[:end]
+                _LOGGER.info("client %d wrote block %s", client_id, block.hex())
+                self.writes.append(block)
+                self.state.apply(block)
+
+
+class SimulatorThread(threading.Thread):
+    """Run simulators on their own event loop, off the loop being measured."""
+
+    def __init__(self, *simulators):
+        super().__init__(daemon=True)
+        self.simulators = simulators
+        self.ready = threading.Event()
+        self.loop = None
+
+    def run(self):
+        self.loop = asyncio.new_event_loop()
+        for simulator in self.simulators:
+            self.loop.run_until_complete(simulator.start())
+        self.ready.set()
+        self.loop.run_forever()
+
+    def stop(self):
+        """Stop the simulators and end the thread"""
+        for simulator in self.simulators:
+            asyncio.run_coroutine_threadsafe(simulator.stop(), self.loop).result(10)
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.join(10)
+
+
+async def main(args=None):
+    """Run the simulator until interrupted"""
+    parser = argparse.ArgumentParser(description="hometop_HT3 proxy simulator")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8088)
+    parser.add_argument("--rate", type=float, default=10.0, help="frames/s, 0: max")
+    parser.add_argument("--garbage", type=float, default=0.0)
+    parser.add_argument("--fragment", type=int, default=0)
+    parser.add_argument("--disconnect", type=float, default=0.0)
+    options = parser.parse_args(args)
+
+    simulator = ProxySimulator(
+        options.host,
+        options.port,
+        rate=options.rate,
+        garbage=options.garbage,
+        fragment=options.fragment,
+        disconnect=options.disconnect,
+    )
+    await simulator.start()
+    try:
+        await asyncio.Event().wait()
+    finally:
+        await simulator.stop()
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    asyncio.run(main())
@@ -1,26 +1,33 @@
 from .driver import Ht3Driver
-import time
+import asyncio
+import sys
 
 
-def message(name, value):
-    print("{} - {}".format(name, value))
+def message(changes):
+    for name, value in changes.items():
+        print("{} - {}".format(name, value))
 
 
-driver = Ht3Driver("raspberrypi-cv")
-driver.set_callback(message)
-driver.start()
-# driver.connect()
+async def main():
+    driver = Ht3Driver("raspberrypi-cv")
+    driver.set_callback(message)
 
-# driver.crc_get("AED1AEAE")
+    if len(sys.argv) > 1:
+        # replay a capture as fast as possible instead of connecting
+        await driver.replay(sys.argv[1], speed=0)
+        return
 
-# driver.run()
-# driver.writeHC_mode(2)
-driver.writeHC_Trequested(21.5)
+    driver.start()
+    driver.start_capture("ht3.cap")
 
-time.sleep(60)
+    # print(driver.crc_get(bytes.fromhex("AED1AEAE")))
 
-driver.stop()
+    # driver.write_hc_mode(2)
+    driver.write_hc_trequested(21.5)
 
-# while True:
-# driver.read()
-#    i=0
+    await asyncio.sleep(60)
+
+    await driver.async_stop()
+
+
+asyncio.run(main())
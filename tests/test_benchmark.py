@@ -0,0 +1,170 @@
+"""Throughput benchmarks of the driver hot path.
+
+Every benchmark is timed against a fixed pure Python reference workload,
+so the committed baselines in benchmark_baseline.json are ratios that
+carry over between machines. A benchmark fails when its ratio drops
+below the baseline by more than HT3_BENCH_TOLERANCE (default 0.3).
+
+Run with HT3_BENCH_UPDATE=1 to write the measured ratios as new
+baselines, with HT3_BENCH=0 to skip the benchmarks.
+"""
+import json
+import os
+import pathlib
+import timeit
+
+import pytest
+
+from custom_components.junkers_ht3 import decoder
+from custom_components.junkers_ht3.crc import crc_append, crc_check
+from custom_components.junkers_ht3.decoder import (
+    FRAME_CH1,
+    FRAME_DHW,
+    FRAME_DT,
+    FRAME_HC,
+)
+from custom_components.junkers_ht3.driver import FRAME_LENGTH, Ht3Driver
+from custom_components.junkers_ht3.scanner import FrameScanner
+
+BASELINE = pathlib.Path(__file__).with_name("benchmark_baseline.json")
+TOLERANCE = float(os.environ.get("HT3_BENCH_TOLERANCE", "0.3"))
+UPDATE = os.environ.get("HT3_BENCH_UPDATE") == "1"
+
+pytestmark = pytest.mark.skipif(
+    os.environ.get("HT3_BENCH") == "0", reason="benchmarks disabled"
+)
+
+
+def _frame(signature, seed):
+    length = FRAME_LENGTH[signature]
+    data = bytes((seed * 7 + i * 13) & 0xFF for i in range(length - len(signature) - 2))
+    return crc_append(signature + data)
+
+
+FRAMES = {
+    signature: [_frame(signature, seed) for seed in range(16)]
+    for signature in FRAME_LENGTH
+}
+STREAM = b"".join(frames[i] for i in range(16) for frames in FRAMES.values())
+STREAM_FRAMES = 16 * len(FRAMES)
+
+
+def _reference():
+    """Fixed workload the benchmarks are measured against."""
+    values = {}
+    for i in range(200):
+        values[i & 31] = values.get(i & 31, 0) + i
+    return values
+
+
+def _rate(function, operations):
+    """Operations per second, best of several runs."""
+    timer = timeit.Timer(function)
+    number, _ = timer.autorange()
+    return operations * number / min(timer.repeat(repeat=3, number=number))
+
+
+def _bench_crc_check():
+    frames = FRAMES[FRAME_CH1]
+    return lambda: [crc_check(frame) for frame in frames], len(frames)
+
+
+def _bench_scanner():
+    scanner = FrameScanner(FRAME_LENGTH, validate=crc_check)
+    chunks = [STREAM[i : i + 64] for i in range(0, len(STREAM), 64)]
+
+    def run():
+        for chunk in chunks:
+            scanner.feed(chunk)
+
+    return run, STREAM_FRAMES
+
+
+def _bench_decoder(message, signature):
+    def bench():
+        frames = FRAMES[signature]
+        decode = message.decode
+        return lambda: [decode(frame) for frame in frames], len(frames)
+
+    return bench
+
+
+def _bench_set_values():
+    driver = Ht3Driver("localhost")
+    decoded = [decoder.CH1.decode(frame) for frame in FRAMES[FRAME_CH1]]
+
+    def run():
+        for values in decoded:
+            driver._set_values(values)
+
+    return run, len(decoded)
+
+
+def _bench_dispatch(subscribers):
+    def bench():
+        driver = Ht3Driver("localhost")
+        decoded = [decoder.CH1.decode(frame) for frame in FRAMES[FRAME_CH1]]
+        names = [name for name, _ in decoded[0]]
+        received = []
+        # `subscribers` entities on every value, as with many gateways;
+        # distinct callables, equal ones are subscribed once
+        for name in names:
+            for i in range(subscribers):
+                driver.subscribe((name,), lambda values, i=i: received.append(values))
+
+        def run():
+            for values in decoded:
+                driver._set_values(values)
+            received.clear()
+
+        return run, len(decoded)
+
+    return bench
+
+
+BENCHMARKS = {
+    "crc_check": _bench_crc_check,
+    "scanner": _bench_scanner,
+    "decode_ch1": _bench_decoder(decoder.CH1, FRAME_CH1),
+    # one entity on the frame, as with most values disabled
+    "decode_ch1_one": _bench_decoder(
+        decoder.CH1.select(("ch_Tflow_measured",)), FRAME_CH1
+    ),
+    "decode_hc": _bench_decoder(decoder.HC, FRAME_HC),
+    "decode_dhw": _bench_decoder(decoder.DHW, FRAME_DHW),
+    "decode_solar": _bench_decoder(decoder.SOLAR, decoder.FRAME_SOLAR),
+    "decode_dt": _bench_decoder(decoder.DT, FRAME_DT),
+    "set_values": _bench_set_values,
+    "dispatch_1": _bench_dispatch(1),
+    "dispatch_10": _bench_dispatch(10),
+    "dispatch_100": _bench_dispatch(100),
+}
+
+
+@pytest.fixture(scope="module")
+def baseline():
+    """Committed baselines, written back in update mode."""
+    data = json.loads(BASELINE.read_text()) if BASELINE.exists() else {}
+    yield data
+    if UPDATE:
+        BASELINE.write_text(json.dumps(data, indent=2, sort_keys=True) + "\n")
+
+
+@pytest.fixture(scope="module")
+def reference_rate():
+    """Runs per second of the reference workload on this machine."""
+    return _rate(_reference, 1)
+
+
+@pytest.mark.parametrize("name", sorted(BENCHMARKS))
+def test_benchmark(name, baseline, reference_rate):
+    """Throughput relative to the reference workload, against the baseline."""
+    function, operations = BENCHMARKS[name]()
+    ratio = _rate(function, operations) / reference_rate
+    if UPDATE or name not in baseline:
+        baseline[name] = round(ratio, 3)
+        return
+    floor = baseline[name] * (1 - TOLERANCE)
+    assert ratio >= floor, "{}: {:.3f} per reference run, baseline {:.3f}".format(
+        name, ratio, baseline[name]
+    )
@@ -0,0 +1,590 @@
+"""Test the Heatronic 3 driver receive path."""
+import asyncio
+import time
+
+from custom_components.junkers_ht3 import decoder, driver as driver_module
+from custom_components.junkers_ht3.capture import (
+    CaptureWriter,
+    read_capture,
+    replay as replay_capture,
+)
+from custom_components.junkers_ht3.crc import (
+    crc_append,
+    crc_calc,
+    crc_check,
+    crc_check_many,
+)
+from custom_components.junkers_ht3.decoder import (
+    FRAME_CH1,
+    FRAME_DT,
+    FRAME_HC2,
+    FRAME_SOLAR,
+)
+from custom_components.junkers_ht3.driver import (
+    FRAME_LENGTH,
+    Ht3Driver,
+    ReconnectPolicy,
+)
+from custom_components.junkers_ht3.filters import ValueFilter
+from custom_components.junkers_ht3.manager import GatewayManager
+from custom_components.junkers_ht3.scanner import FrameScanner
+from custom_components.junkers_ht3.simulator import ProxySimulator
+
+DT_FRAME = crc_append(FRAME_DT + bytes([22, 10, 12, 18, 30, 15, 0, 0]))
+
+
+def test_scanner_fragmented_stream():
+    """Frames split over many chunks are reassembled."""
+    scanner = FrameScanner(FRAME_LENGTH)
+    stream = DT_FRAME * 3
+    frames = []
+    for pos in range(0, len(stream), 5):
+        frames += scanner.feed(stream[pos : pos + 5])
+    assert frames == [(FRAME_DT, DT_FRAME)] * 3
+    assert scanner.pending == 0
+
+
+def test_scanner_resync_after_garbage():
+    """Garbage and frames failing validation are skipped."""
+    scanner = FrameScanner(FRAME_LENGTH, validate=crc_check)
+    broken = DT_FRAME[:-2] + b"\xff\x00"
+    frames = scanner.feed(b"\x01\x02" + broken + DT_FRAME + b"\x03")
+    assert frames == [(FRAME_DT, DT_FRAME)]
+    assert scanner.skipped == 2 + len(broken)
+
+
+def test_scanner_skips_unknown_telegrams():
+    """A telegram of another type is skipped whole, its data is not misread."""
+    unknown = crc_append(b"\x88\x00\x19\x00" + FRAME_DT + bytes(12))
+    stream = (DT_FRAME + unknown) * 2 + DT_FRAME
+    for size in (len(stream), 3):
+        scanner = FrameScanner(FRAME_LENGTH, validate=crc_check)
+        frames = []
+        for pos in range(0, len(stream), size):
+            frames += scanner.feed(stream[pos : pos + size])
+        assert frames == [(FRAME_DT, DT_FRAME)] * 3
+        assert scanner.unknown == 2
+        assert scanner.rejected == 0
+        assert scanner.skipped == len(unknown) * 2
+        assert scanner.pending == 0
+        # the second one is skipped by its known length
+        assert scanner._learned == {unknown[:4]: len(unknown)}
+
+
+def test_scanner_shorter_telegram_under_learned_header():
+    """A learned length is only trusted if the telegram checks out."""
+    long = crc_append(b"\x88\x00\x19\x00" + bytes(range(1, 21)))
+    short = crc_append(b"\x88\x00\x19\x00" + b"\x01\x02")
+    for size in (64, 1):
+        scanner = FrameScanner(FRAME_LENGTH, validate=crc_check)
+        frames = []
+        for stream in (DT_FRAME + long + DT_FRAME, short + DT_FRAME * 2):
+            for pos in range(0, len(stream), size):
+                frames += scanner.feed(stream[pos : pos + size])
+        assert frames == [(FRAME_DT, DT_FRAME)] * 4
+        assert scanner.unknown == 2
+        assert scanner.skipped == len(long) + len(short)
+
+
+def test_scanner_garbage_after_frame():
+    """Garbage ending like a telegram does not swallow the frame inside it."""
+    garbage = b"\x11\x23"
+    # the CRC of garbage and frame, then a break byte: a telegram to the scanner
+    bogus_end = bytes((crc_calc(garbage + DT_FRAME), 0))
+    stream = DT_FRAME + garbage + DT_FRAME + bogus_end + DT_FRAME
+    for size in (len(stream), 5):
+        scanner = FrameScanner(FRAME_LENGTH, validate=crc_check)
+        frames = []
+        for pos in range(0, len(stream), size):
+            frames += scanner.feed(stream[pos : pos + size])
+        assert frames == [(FRAME_DT, DT_FRAME)] * 3
+        assert scanner.skipped == len(garbage) + len(bogus_end)
+
+
+def test_scanner_bounded_buffer():
+    """Unknown data never accumulates in the scanner."""
+    scanner = FrameScanner(FRAME_LENGTH)
+    for _ in range(1000):
+        scanner.feed(b"\x55" * 1024)
+    # at most a partial signature is kept
+    assert scanner.pending < max(len(signature) for signature in FRAME_LENGTH)
+
+
+def test_driver_decodes_date_time():
+    """A date/time frame sets the ht3_time value."""
+    driver = Ht3Driver("localhost")
+    driver.subscribe(("ht3_time",), lambda changes: None)
+    driver._handle_messages(memoryview(DT_FRAME))
+    assert driver.dict["ht3_time"] == "2022-10-18 12:30:15"
+
+
+def test_decoder_registry():
+    """Frames are decoded per circuit, and only when their values are used."""
+    driver = Ht3Driver("localhost")
+    hc2 = crc_append(FRAME_HC2 + bytes([3, 1, 0, 215, 0, 201]))
+    solar = crc_append(FRAME_SOLAR + bytes.fromhex("3200000fff9c00d6010400fbd0"))
+    driver._handle_messages(DT_FRAME + hc2 + solar)
+    assert driver.dict == {}
+    assert driver.metrics()["frames_hc"] == 1
+
+    calls = []
+    driver.subscribe(("hc2_Tmeasured", "sol_Tcollector"), calls.append)
+    driver._handle_messages(DT_FRAME + hc2 + solar)
+    assert calls == [{"hc2_Tmeasured": 20.1}, {"sol_Tcollector": -10.0}]
+    assert driver.dict == {"hc2_Tmeasured": 20.1, "sol_Tcollector": -10.0}
+
+    driver.set_callback(calls.append)
+    driver._handle_messages(DT_FRAME + solar)
+    assert driver.dict["ht3_time"] == "2022-10-18 12:30:15"
+    assert driver.dict["sol_pump"] == 1
+    assert driver.dict["sol_cylinder_heated"] == 1
+
+
+def test_decode_subscribed_fields_only():
+    """Only the subscribed fields of a frame are decoded."""
+    frame = crc_append(FRAME_CH1 + bytes(range(25)))
+    values = dict(decoder.CH1.decode(frame))
+    assert decoder.CH1.select(("ch_code", "dhw_Tmeasured")).decode(frame) == [
+        ("ch_code", values["ch_code"])
+    ]
+    assert decoder.CH1.select(("dhw_Tmeasured",)) is None
+    assert decoder.DT.select(("ht3_time",)) is decoder.DT
+
+    driver = Ht3Driver("localhost")
+    unsubscribe = driver.subscribe(("ch_code",), lambda changes: None)
+    driver.subscribe(("ch_Tflow_measured",), lambda changes: None)
+    driver._handle_messages(frame)
+    assert set(driver.dict) == {"ch_code", "ch_Tflow_measured"}
+
+    # an entity removed or disabled drops its value from decoding
+    unsubscribe()
+    driver._handle_messages(frame)
+    assert set(driver.dict) == {"ch_Tflow_measured"}
+
+
+def test_decoder_status_bits():
+    """Bit fields of one status byte are decoded from a single raw value."""
+    body = bytearray(29)
+    body[0:4] = FRAME_CH1
+    body[5:7] = (412).to_bytes(2, "big")
+    body[9] = 0x0A
+    body[11] = 0xA1
+    values = dict(decoder.CH1.decode(crc_append(body)))
+    assert values["ch_Tflow_measured"] == 41.2
+    assert values["ch_burner_operation"] == 1
+    assert values["ch_mode"] == 2
+    assert values["ch_pump_heating"] == 1
+    assert values["ch_pump_cylinder"] == 0
+    assert values["ch_pump_circulation"] == 1
+    assert values["ch_burner_fan"] == 1
+
+
+def test_crc_check_many():
+    """Batch verification reports each frame of a capture."""
+    broken = DT_FRAME[:-2] + b"\xff\x00"
+    assert crc_check_many([DT_FRAME, broken, DT_FRAME, b"\x00"]) == [
+        True,
+        False,
+        True,
+        False,
+    ]
+
+
+def test_subscribe_keyed_dispatch():
+    """Only subscribers of a changed value are called, once per frame."""
+    driver = Ht3Driver("localhost")
+    calls = []
+    unsubscribe = driver.subscribe(("ht3_time", "hc_mode"), calls.append)
+    driver.subscribe(("hc_auto",), calls.append)
+    driver._handle_messages(DT_FRAME)
+    driver._handle_messages(DT_FRAME)
+    assert calls == [{"ht3_time": "2022-10-18 12:30:15"}]
+    unsubscribe()
+    driver._set_values([("ht3_time", "2022-10-18 12:31:00"), ("hc_auto", 2)])
+    assert calls[1:] == [{"hc_auto": 2}]
+
+
+async def test_coalesce_changes():
+    """Changes within the coalescing window are delivered in one call."""
+    driver = Ht3Driver("localhost", coalesce=0.05)
+    calls = []
+    driver.set_callback(calls.append)
+    driver._set_values([("hc_mode", 2), ("hc_auto", 1)])
+    driver._set_values([("hc_mode", 3)])
+    assert calls == []
+    await asyncio.sleep(0.1)
+    assert calls == [{"hc_mode": 3, "hc_auto": 1}]
+
+
+def test_value_filter_deadband():
+    """Jitter inside the deadband is held back until the heartbeat."""
+    driver = Ht3Driver("localhost")
+    driver.set_filters({"dhw_Tmeasured": ValueFilter(deadband=0.5, heartbeat=300)})
+    calls = []
+    driver.set_callback(calls.append)
+    for value in (48.0, 48.1, 47.9, 48.2, 48.6):
+        driver._set_values([("dhw_Tmeasured", value)])
+    assert calls == [{"dhw_Tmeasured": 48.0}, {"dhw_Tmeasured": 48.6}]
+
+    driver._published["dhw_Tmeasured"] = (48.6, time.monotonic() - 301)
+    driver._set_values([("dhw_Tmeasured", 48.5)])
+    assert calls[-1] == {"dhw_Tmeasured": 48.5}
+
+    # the heartbeat republishes an unchanged value as a keep-alive
+    driver._published["dhw_Tmeasured"] = (48.5, time.monotonic() - 301)
+    driver._set_values([("dhw_Tmeasured", 48.5)])
+    assert len(calls) == 4
+
+
+def test_value_filter_zero_transition():
+    """A change to or from 0 passes the deadband."""
+    burner = ValueFilter(deadband=2, min_interval=10, heartbeat=300)
+    assert not burner.accept(2, 1, 60)
+    assert burner.accept(0, 1, 60)
+    assert burner.accept(1, 0, 60)
+    assert not burner.accept(0, 1, 5)
+
+
+async def test_command_queue_keeps_latest_setpoint(monkeypatch):
+    """Repeated setpoints are merged and sent in order without blocking."""
+    monkeypatch.setattr(driver_module, "WRITE_BLOCK_GAP", 0)
+    driver = Ht3Driver("localhost")
+    sent = []
+
+    async def write(block):
+        sent.append(bytes(block))
+
+    driver._write = write
+    driver.write_hc_trequested(20)
+    driver.write_hc_mode(3)
+    driver.write_hc_trequested(21.5)
+    assert driver.queue_depth() == 2
+
+    task = asyncio.get_running_loop().create_task(driver._send_commands())
+    driver._online.set()
+    await asyncio.sleep(0.01)
+    task.cancel()
+
+    assert [block[-1] for block in sent] == [43, 43, 3, 3]
+    assert driver.queue_depth() == 0
+    assert driver.write_latency is not None
+
+
+async def test_command_acknowledged_by_bus(monkeypatch):
+    """A sent setpoint is matched against the next decoded hc frame."""
+    monkeypatch.setattr(driver_module, "WRITE_BLOCK_GAP", 0)
+    driver = Ht3Driver("localhost", ack_timeout=0.05, ack_retries=1)
+    sent = []
+
+    async def write(block):
+        sent.append(bytes(block))
+
+    driver._write = write
+    task = asyncio.get_running_loop().create_task(driver._send_commands())
+    driver._online.set()
+
+    driver.write_hc_trequested(21.5)
+    await asyncio.sleep(0.01)
+    assert driver._dispatch()[decoder.FRAME_HC1][1] is not None
+    driver._set_values([("hc_Tdesired", 21.5), ("hc_mode", 3)])
+    assert driver.ack_rtt.count == 1
+    # nobody subscribes to the acknowledged value, it is not decoded anymore
+    assert driver._dispatch()[decoder.FRAME_HC1][1] is None
+
+    # never acknowledged: sent once more, then given up
+    driver.write_hc_mode(2)
+    await asyncio.sleep(0.2)
+    task.cancel()
+    assert [block[-1] for block in sent] == [43, 43, 2, 2, 2, 2]
+    assert driver.ack_rtt.count == 1
+    assert not driver._acks
+
+
+async def test_cancel_drops_pending_acks(monkeypatch):
+    """No retry timer fires once the driver is cancelled."""
+    monkeypatch.setattr(driver_module, "WRITE_BLOCK_GAP", 0)
+    driver = Ht3Driver("localhost", ack_timeout=0.05, ack_retries=1)
+    sent = []
+
+    async def write(block):
+        sent.append(bytes(block))
+
+    driver._write = write
+    driver._command_task = asyncio.get_running_loop().create_task(
+        driver._send_commands()
+    )
+    driver._online.set()
+
+    driver.write_hc_mode(2)
+    await asyncio.sleep(0.01)
+    assert driver._acks
+    await driver.async_stop()
+    assert not driver._acks
+    await asyncio.sleep(0.1)
+    assert driver.queue_depth() == 0
+    assert len(sent) == 2
+
+
+def test_reconnect_backoff():
+    """First retry is immediate, then exponential with jitter up to a cap."""
+    policy = ReconnectPolicy(minimum=1, maximum=8, stable=60)
+    delays = [policy.next_delay() for _ in range(7)]
+    assert delays[0] == 0
+    for delay, bound in zip(delays[1:], (1, 2, 4, 8, 8, 8)):
+        assert bound / 2 <= delay <= bound
+
+    # a flapping connection keeps backing off, a stable one starts over
+    policy.connection_lost(5)
+    assert policy.next_delay() >= 4
+    policy.connection_lost(60)
+    assert policy.next_delay() == 0
+
+    # a proxy down for days keeps the maximum delay
+    policy = ReconnectPolicy(minimum=0.5, maximum=60)
+    policy.attempts = 5000
+    assert 30 <= policy.next_delay() <= 60
+
+
+async def test_receive_loop_logs_unexpected_errors(caplog):
+    """The receive task does not end silently."""
+    driver = Ht3Driver("localhost")
+
+    async def connect():
+        raise RuntimeError("boom")
+
+    driver.connect = connect
+    await driver.start()
+    assert "receive loop failed" in caplog.text
+    assert "boom" in caplog.text
+    await driver.async_stop()
+
+
+async def test_capture_replay(tmp_path):
+    """A recorded stream replays through the parser with its timing."""
+    path = tmp_path / "ht3.cap"
+    capture = CaptureWriter(path)
+    capture.write(DT_FRAME[:5], timestamp=100.0)
+    capture.write(DT_FRAME[5:], timestamp=100.05)
+    # buffered, nothing is written on the event loop
+    assert not path.exists()
+    await capture.close()
+    assert [data for _, data in read_capture(path)] == [DT_FRAME[:5], DT_FRAME[5:]]
+
+    # small buffers flush while writing and keep the records in order
+    small = tmp_path / "small.cap"
+    capture = CaptureWriter(small, buffer_size=16)
+    for index in range(50):
+        capture.write(bytes([index]) * 8, timestamp=200.0 + index)
+    await capture.close()
+    assert [data[0] for _, data in read_capture(small)] == list(range(50))
+
+    driver = Ht3Driver("localhost")
+    driver.subscribe(("ht3_time",), lambda changes: None)
+    start = time.monotonic()
+    assert await driver.replay(path) == 2
+    assert time.monotonic() - start >= 0.04
+    assert driver.dict["ht3_time"] == "2022-10-18 12:30:15"
+
+    driver = Ht3Driver("localhost")
+    driver.subscribe(("ht3_time",), lambda changes: None)
+    assert await driver.replay(path, speed=0) == 2
+    assert driver.dict["ht3_time"] == "2022-10-18 12:30:15"
+
+    # appended by a process with an unrelated monotonic clock: each session
+    # replays with its own spacing
+    capture = CaptureWriter(path)
+    capture.write(DT_FRAME, timestamp=5.0)
+    capture.write(DT_FRAME, timestamp=5.05)
+    await capture.close()
+    assert len([data for _, data in read_capture(path, sessions=True)]) == 6
+    start = time.monotonic()
+    assert await replay_capture(path, lambda data: None) == 4
+    assert 0.09 <= time.monotonic() - start < 1
+
+
+async def test_simulator_end_to_end(monkeypatch):
+    """The driver registers with the simulator, decodes frames and writes."""
+    monkeypatch.setattr(driver_module, "WRITE_BLOCK_GAP", 0)
+    simulator = ProxySimulator(port=0, rate=0, garbage=0.2, fragment=7, seed=1)
+    port = await simulator.start()
+    driver = Ht3Driver("127.0.0.1", port)
+    driver.subscribe(("ht3_time", "hc_mode", "hc_Tdesired"), lambda changes: None)
+    driver.start()
+    try:
+        for _ in range(100):
+            await asyncio.sleep(0.02)
+            if "ht3_time" in driver.dict and "hc_mode" in driver.dict:
+                break
+        assert driver.connected()
+        assert driver.clientID() == "1"
+        assert driver.dict["hc_Tdesired"] == 21.0
+
+        driver.write_hc_trequested(22.5)
+        for _ in range(100):
+            await asyncio.sleep(0.02)
+            if driver.ack_rtt.count:
+                break
+        assert simulator.writes[0][-1] == 45
+        assert driver.dict["hc_Tdesired"] == 22.5
+    finally:
+        await driver.async_stop()
+        await simulator.stop()
+
+
+async def test_command_resent_after_reconnect(monkeypatch):
+    """A command cut by a reconnect goes out in full on the next connection."""
+    monkeypatch.setattr(driver_module, "WRITE_BLOCK_GAP", 0.5)
+    simulator = ProxySimulator(port=0, rate=200, seed=1)
+    port = await simulator.start()
+    driver = Ht3Driver("127.0.0.1", port)
+    driver.start()
+    try:
+        for _ in range(100):
+            await asyncio.sleep(0.02)
+            if driver.connected():
+                break
+        driver.write_hc_mode(2)
+        for _ in range(100):
+            await asyncio.sleep(0.01)
+            if simulator.writes:
+                break
+        simulator.drop_clients()
+        for _ in range(200):
+            await asyncio.sleep(0.02)
+            if len(simulator.writes) >= 3:
+                break
+        first, again, second = simulator.writes
+        assert first == again != second
+        assert second[-1] == 2
+        assert driver.connects == 2
+        assert driver.disconnects == 1
+    finally:
+        await driver.async_stop()
+        await simulator.stop()
+
+
+async def test_write_error_closes_connection():
+    """A failed write drops the connection for the receive loop to renew."""
+
+    class BrokenWriter:
+        def write(self, data):
+            pass
+
+        async def drain(self):
+            raise ConnectionResetError("reset by peer")
+
+        def close(self):
+            pass
+
+    driver = Ht3Driver("localhost")
+    driver._writer = BrokenWriter()
+    driver._connected = True
+    driver._online.set()
+    try:
+        await driver._write(b"RX")
+    except ConnectionError:
+        pass
+    else:
+        raise AssertionError("write error not raised")
+    assert not driver.connected()
+    assert not driver._online.is_set()
+    assert driver.disconnects == 1
+
+
+async def test_stop_is_prompt():
+    """Stopping ends a pending read or reconnect delay at once."""
+    simulator = ProxySimulator(port=0, rate=0, seed=1)
+    port = await simulator.start()
+    driver = Ht3Driver("127.0.0.1", port)
+    try:
+        driver.start()
+        for _ in range(100):
+            await asyncio.sleep(0.02)
+            if driver.connected():
+                break
+        assert driver.connected()
+
+        # paused: no socket and no receive task left to wake up
+        start = time.monotonic()
+        driver.stop()
+        await driver.join()
+        assert time.monotonic() - start < 1
+        assert driver._task is None and not driver._ending
+        assert not driver.connected()
+
+        driver.restart()
+        for _ in range(100):
+            await asyncio.sleep(0.02)
+            if driver.connected():
+                break
+        assert driver.connected()
+    finally:
+        await simulator.stop()
+
+    # the proxy is gone, the driver waits for the next connect attempt
+    driver._close()
+    driver._reconnect.attempts = 10
+    await asyncio.sleep(0.05)
+    start = time.monotonic()
+    await driver.async_stop()
+    assert time.monotonic() - start < 1
+    assert driver._task is None and driver._command_task is None
+
+
+async def test_shared_connection():
+    """Consumers of one proxy share a driver until the last one releases it."""
+    manager = GatewayManager()
+    first = manager.add("entry1", "Proxy.local", 8088)
+    second = manager.add("entry2", "proxy.local", "8088")
+    other = manager.acquire("other.local", 8088)
+    assert first is second
+    assert first is not other
+    assert len(manager) == 2
+
+    manager.start()
+    await manager.remove("entry1")
+    assert manager.get("entry2") is first
+    assert not first._stop
+    await manager.remove("entry2")
+    assert first._stop
+    assert first._task is None and first._command_task is None
+    assert "entry2" not in manager
+    assert list(manager.stats()) == ["other.local:8088"]
+    await manager.stop()
+    assert other._task is None
+
+
+def test_driver_metrics():
+    """Received bytes, frames per type and rejected frames are counted."""
+    driver = Ht3Driver("localhost")
+    calls = []
+    driver.subscribe(("ht3_time",), calls.append)
+    broken = bytearray(DT_FRAME)
+    broken[-2] ^= 0xFF
+    driver._handle_messages(b"\x01\x02" + bytes(broken) + DT_FRAME)
+
+    metrics = driver.metrics()
+    assert metrics["bytes_received"] == 2 + 2 * len(DT_FRAME)
+    assert metrics["frames_dt"] == 1
+    assert metrics["frames_ch1"] == 0
+    assert metrics["crc_errors"] == 1
+    assert metrics["buffer_high_water"] == 2 + 2 * len(DT_FRAME)
+    assert metrics["decode_time_count"] == 1
+    assert metrics["callback_time_count"] == 1
+    assert metrics["ack_rtt_p50"] is None
+
+
+def test_frame_log():
+    """The ring buffer keeps the last frames with their outcome."""
+    driver = Ht3Driver("localhost", frame_log_size=3)
+    broken = bytearray(DT_FRAME)
+    broken[-2] ^= 0xFF
+    driver._handle_messages(DT_FRAME + b"\x01\x02" + bytes(broken) + DT_FRAME)
+
+    # ok, unknown 0102, crc, unknown rest of the broken frame, ok
+    entries = driver.diagnostics()["frames"]
+    assert [entry["outcome"] for entry in entries] == ["crc", "unknown", "ok"]
+    assert entries[0]["frame"] == broken.hex()
+    assert entries[1]["frame"] == broken[1:].hex()
+    assert entries[2]["frame"] == DT_FRAME.hex()
+    assert driver.frame_log.count == 5
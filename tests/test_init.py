@@ -1,9 +1,114 @@
 """Test component setup."""
+from homeassistant.const import CONF_HOST, CONF_PORT
+from homeassistant.helpers import entity_registry as er
 from homeassistant.setup import async_setup_component
+from pytest_homeassistant_custom_component.common import MockConfigEntry
 
-from custom_components.junkers_ht3.const import DOMAIN
+from custom_components.junkers_ht3.const import (
+    DOMAIN,
+    KEY_GATEWAY,
+    KEY_MANAGER,
+    METRIC_DICT,
+    SERVICE_DUMP_FRAMES,
+    SERVICE_RECONNECT,
+)
+from custom_components.junkers_ht3.decoder import REGISTRY
+from custom_components.junkers_ht3.simulator import ProxySimulator
 
 
 async def test_async_setup(hass):
     """Test the component gets setup."""
     assert await async_setup_component(hass, DOMAIN, {}) is True
+
+
+def test_frame_metrics():
+    """Every registered frame type has its counter sensor."""
+    for entry in REGISTRY:
+        assert "frames_" + entry.kind in METRIC_DICT
+
+
+async def _setup_entries(hass, port, count):
+    entries = []
+    for _ in range(count):
+        entry = MockConfigEntry(
+            domain=DOMAIN, data={CONF_HOST: "127.0.0.1", CONF_PORT: port}
+        )
+        entry.add_to_hass(hass)
+        assert await hass.config_entries.async_setup(entry.entry_id)
+        entries.append(entry)
+    await hass.async_block_till_done()
+    return entries
+
+
+async def test_services(hass, enable_custom_integrations):
+    """The services are registered once and reconnect one or all gateways."""
+    simulator = ProxySimulator(port=0, rate=0)
+    port = await simulator.start()
+    first, second = await _setup_entries(hass, port, 2)
+    assert hass.services.has_service(DOMAIN, SERVICE_RECONNECT)
+    assert hass.services.has_service(DOMAIN, SERVICE_DUMP_FRAMES)
+
+    await hass.services.async_call(DOMAIN, SERVICE_RECONNECT, {}, blocking=True)
+    await hass.services.async_call(
+        DOMAIN, SERVICE_RECONNECT, {"entry_id": second.entry_id}, blocking=True
+    )
+    assert set(hass.data[KEY_GATEWAY]) == {first.entry_id, second.entry_id}
+
+    for entry in (first, second):
+        assert await hass.config_entries.async_unload(entry.entry_id)
+    await simulator.stop()
+
+
+async def test_value_entities_per_gateway(hass, enable_custom_integrations):
+    """Every gateway gets its own value entities, old unique IDs are migrated."""
+    simulator = ProxySimulator(port=0, rate=0)
+    port = await simulator.start()
+    registry = er.async_get(hass)
+    old = MockConfigEntry(domain=DOMAIN, data={CONF_HOST: "127.0.0.1", CONF_PORT: port})
+    old.add_to_hass(hass)
+    migrated = registry.async_get_or_create(
+        "sensor", DOMAIN, "ch_Tflow_measured", config_entry=old
+    )
+    assert await hass.config_entries.async_setup(old.entry_id)
+    (other,) = await _setup_entries(hass, port, 1)
+
+    assert registry.async_get(migrated.entity_id).unique_id == (
+        f"{old.entry_id}/ch_Tflow_measured"
+    )
+    for entry in (old, other):
+        unique_ids = {
+            entity.unique_id
+            for entity in er.async_entries_for_config_entry(registry, entry.entry_id)
+        }
+        assert f"{entry.entry_id}/ch_Tflow_measured" in unique_ids
+        assert f"{entry.entry_id}/ch_burner_operation" in unique_ids
+
+    for entry in (old, other):
+        assert await hass.config_entries.async_unload(entry.entry_id)
+    await simulator.stop()
+
+
+async def test_unload_entry(hass, enable_custom_integrations):
+    """Unloading an entry keeps the proxy connection until the last one goes."""
+    simulator = ProxySimulator(port=0, rate=0)
+    port = await simulator.start()
+    first, second = await _setup_entries(hass, port, 2)
+    manager = hass.data[KEY_MANAGER]
+    driver = hass.data[KEY_GATEWAY][first.entry_id]
+    assert hass.data[KEY_GATEWAY][second.entry_id] is driver
+    assert len(manager) == 1
+
+    assert await hass.config_entries.async_unload(first.entry_id)
+    assert first.entry_id not in hass.data[KEY_GATEWAY]
+    assert len(manager) == 1
+    assert not driver._stop
+    assert hass.services.has_service(DOMAIN, SERVICE_RECONNECT)
+
+    assert await hass.config_entries.async_unload(second.entry_id)
+    assert not hass.data[KEY_GATEWAY]
+    assert len(manager) == 0
+    assert driver._stop
+    assert driver._task is None and driver._command_task is None
+    assert not hass.services.has_service(DOMAIN, SERVICE_RECONNECT)
+    assert not hass.services.has_service(DOMAIN, SERVICE_DUMP_FRAMES)
+    await simulator.stop()
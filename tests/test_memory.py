@@ -0,0 +1,99 @@
+"""Memory regression test of the receive path.
+
+Pushes synthetic frames, frames of unknown types and garbage through the
+driver and checks with tracemalloc snapshots that memory stays flat once
+warmed up. HT3_MEMORY_FRAMES sets the number of frames (default 50000),
+e.g. HT3_MEMORY_FRAMES=5000000 for a run of several days of bus traffic.
+"""
+import os
+import random
+import resource
+import tracemalloc
+
+from custom_components.junkers_ht3.crc import crc_append
+from custom_components.junkers_ht3.driver import FRAME_LENGTH, Ht3Driver
+from custom_components.junkers_ht3.filters import ValueFilter
+
+FRAMES = int(os.environ.get("HT3_MEMORY_FRAMES", "50000"))
+SNAPSHOTS = 10
+# growth allowed after the first snapshot
+TRACED_BUDGET = 256 * 1024
+RSS_BUDGET = 16 * 1024 * 1024
+TOP_SITES = 10
+
+# valid frames of types the driver does not decode
+UNKNOWN = (b"\x88\x00\x19\x00", b"\x90\x00\x0c\x00", b"\xa0\x00\xff\x00")
+
+
+def _traffic(rng):
+    """Endless chunks of mixed bus traffic and the frames in each chunk."""
+    known = tuple(FRAME_LENGTH.items())
+    while True:
+        chunk = bytearray()
+        frames = 0
+        for _ in range(rng.randint(1, 8)):
+            kind = rng.random()
+            if kind < 0.1:
+                chunk += rng.randbytes(rng.randint(1, 40))
+            elif kind < 0.2:
+                chunk += crc_append(rng.choice(UNKNOWN) + rng.randbytes(10))
+            else:
+                signature, length = rng.choice(known)
+                chunk += crc_append(
+                    signature + rng.randbytes(length - len(signature) - 2)
+                )
+                frames += 1
+        yield bytes(chunk), frames
+
+
+def _rss():
+    """Peak resident set size in bytes (Linux reports KiB)."""
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+def test_memory_stays_flat():
+    """Traced and resident memory stay within budget over many frames."""
+    rng = random.Random(1)
+    driver = Ht3Driver("localhost")
+    driver.set_filters({"ch_Tflow_measured": ValueFilter(deadband=0.5)})
+    received = []
+    driver.subscribe(("hc_Tmeasured", "ht3_time"), received.append)
+    traffic = _traffic(rng)
+
+    step = max(FRAMES // SNAPSHOTS, 1)
+    tracemalloc.start()
+    try:
+        sent = 0
+        baseline = None
+        while sent < FRAMES:
+            target = sent + step
+            while sent < target:
+                chunk, frames = next(traffic)
+                driver._handle_messages(chunk)
+                sent += frames
+            received.clear()
+
+            snapshot = tracemalloc.take_snapshot()
+            traced, _ = tracemalloc.get_traced_memory()
+            if baseline is None:
+                # first interval is warm up: all keys seen, buffers allocated
+                baseline = snapshot, traced, _rss()
+                continue
+
+            growth = traced - baseline[1]
+            rss_growth = _rss() - baseline[2]
+            if growth > TRACED_BUDGET or rss_growth > RSS_BUDGET:
+                sites = snapshot.compare_to(baseline[0], "lineno")[:TOP_SITES]
+                raise AssertionError(
+                    "memory grew by {} bytes traced, {} bytes resident after {} "
+                    "frames, top allocation sites:\n{}".format(
+                        growth,
+                        rss_growth,
+                        sent,
+                        "\n".join(str(site) for site in sites),
+                    )
+                )
+    finally:
+        tracemalloc.stop()
+
+    assert driver._scanner.pending < max(FRAME_LENGTH.values()) * 2
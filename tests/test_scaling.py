@@ -0,0 +1,95 @@
+"""Scaling of many gateways on one event loop.
+
+Connects 1, 10 and 100 drivers through a GatewayManager to as many proxy
+simulators running in their own thread and measures the CPU time of the
+event loop thread per frame and the loop lag. HT3_SCALING_GATEWAYS
+overrides the gateway counts (e.g. "1,100,300"), HT3_SCALING_SECONDS
+the measuring time per count.
+"""
+import asyncio
+import os
+import time
+
+from custom_components.junkers_ht3.manager import GatewayManager
+from custom_components.junkers_ht3.metrics import Histogram
+from custom_components.junkers_ht3.simulator import ProxySimulator, SimulatorThread
+
+GATEWAYS = tuple(
+    int(count)
+    for count in os.environ.get("HT3_SCALING_GATEWAYS", "1,10,100").split(",")
+)
+SECONDS = float(os.environ.get("HT3_SCALING_SECONDS", "2"))
+# frames per second and gateway, a real bus sends a few
+RATE = 20
+LAG_INTERVAL = 0.01
+LAG_BUCKETS = tuple(0.0005 * 2**i for i in range(12))
+
+
+def _frames_sent(simulators):
+    return sum(simulator.frames_sent for simulator in simulators)
+
+
+async def _measure(simulators):
+    manager = GatewayManager()
+    drivers = [
+        manager.add(key, "127.0.0.1", simulator.port)
+        for key, simulator in enumerate(simulators)
+    ]
+    received = []
+    for driver in drivers:
+        driver.subscribe(("hc_Tmeasured", "ht3_time"), received.append)
+    manager.start()
+
+    lag = Histogram(LAG_BUCKETS)
+    for _ in range(500):
+        await asyncio.sleep(0.01)
+        if all(driver.connected() for driver in drivers):
+            break
+
+    frames = _frames_sent(simulators)
+    cpu = time.thread_time()
+    end = time.monotonic() + SECONDS
+    while time.monotonic() < end:
+        start = time.monotonic()
+        await asyncio.sleep(LAG_INTERVAL)
+        lag.observe(time.monotonic() - start - LAG_INTERVAL)
+    cpu = time.thread_time() - cpu
+    frames = _frames_sent(simulators) - frames
+
+    connected = sum(driver.connected() for driver in drivers)
+    await manager.stop()
+    # let the simulators see the closed connections
+    await asyncio.sleep(0.1)
+    return connected, frames, cpu / max(frames, 1), lag.quantile(0.99)
+
+
+async def test_gateways_scale():
+    """CPU per frame stays about flat from 10 to 100 gateways."""
+    # one proxy per gateway, connections to the same proxy would be shared
+    simulators = [
+        ProxySimulator(port=0, rate=RATE, seed=gateway)
+        for gateway in range(max(GATEWAYS))
+    ]
+    thread = SimulatorThread(*simulators)
+    thread.start()
+    assert thread.ready.wait(10)
+
+    results = {}
+    try:
+        for gateways in GATEWAYS:
+            connected, frames, cpu, lag = await _measure(simulators[:gateways])
+            results[gateways] = cpu
+            print(
+                "{:4d} gateways: {} connected, {:6d} frames, {:6.1f} us cpu/frame, "
+                "p99 loop lag {} ms".format(
+                    gateways, connected, frames, cpu * 1e6, lag * 1000
+                )
+            )
+            assert connected == gateways
+            assert frames
+    finally:
+        thread.stop()
+
+    counts = sorted(results)
+    if len(counts) > 1 and counts[-2] >= 10:
+        assert results[counts[-1]] < results[counts[-2]] * 2
@@ -0,0 +1,165 @@
+"""Soak test from the proxy socket to Home Assistant entity states.
+
+Skipped unless HT3_SOAK holds the duration in seconds, e.g.
+
+    HT3_SOAK=3600 HT3_SOAK_RATE=400 pytest tests/test_soak.py -s
+
+The simulator streams frames from its own thread at HT3_SOAK_RATE
+frames/s into the integration set up from a config entry. Reported are:
+- latency from a chunk arriving on the socket to the entity states it
+  changed being written (p50/p95/p99)
+- event loop lag
+- CPU time of the event loop thread per frame
+
+The report is written as JSON to HT3_SOAK_REPORT (soak_report.json) and
+printed next to the report given in HT3_SOAK_COMPARE, if any.
+"""
+import asyncio
+import bisect
+import json
+import os
+import subprocess
+import time
+
+import pytest
+from homeassistant.const import CONF_HOST, CONF_PORT, EVENT_STATE_CHANGED
+from homeassistant.core import callback
+from pytest_homeassistant_custom_component.common import MockConfigEntry
+
+from custom_components.junkers_ht3.const import DOMAIN, KEY_GATEWAY
+from custom_components.junkers_ht3.metrics import Histogram
+from custom_components.junkers_ht3.simulator import ProxySimulator, SimulatorThread
+
+DURATION = float(os.environ.get("HT3_SOAK", "0"))
+RATE = float(os.environ.get("HT3_SOAK_RATE", "400"))
+REPORT = os.environ.get("HT3_SOAK_REPORT", "soak_report.json")
+COMPARE = os.environ.get("HT3_SOAK_COMPARE")
+
+LAG_INTERVAL = 0.05
+# chunks older than this can not be matched to a state write anymore
+WINDOW_KEEP = 10.0
+# 10 us to about 10 s in steps of 10%
+BUCKETS = tuple(1e-5 * 1.1**i for i in range(146))
+
+
+def _percentiles(histogram):
+    percentiles = {}
+    for name, fraction in (("p50", 0.5), ("p95", 0.95), ("p99", 0.99)):
+        value = histogram.quantile(fraction)
+        percentiles[name] = None if value is None else round(value * 1000, 3)
+    return percentiles
+
+
+def _commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            capture_output=True,
+            check=True,
+            text=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def _print_report(report, previous):
+    for key, value in report.items():
+        if previous is not None:
+            print("{:18} {!s:40} {}".format(key, value, previous.get(key)))
+        else:
+            print("{:18} {}".format(key, value))
+
+
+@pytest.mark.skipif(not DURATION, reason="set HT3_SOAK to the duration in seconds")
+async def test_soak(hass, enable_custom_integrations):
+    """Sustained load from the simulator through the integration."""
+    simulator = ProxySimulator(port=0, rate=RATE, seed=1)
+    thread = SimulatorThread(simulator)
+    thread.start()
+    assert thread.ready.wait(10)
+
+    entry = MockConfigEntry(
+        domain=DOMAIN,
+        data={CONF_HOST: "127.0.0.1", CONF_PORT: simulator.port},
+    )
+    entry.add_to_hass(hass)
+    assert await hass.config_entries.async_setup(entry.entry_id)
+    await hass.async_block_till_done()
+    driver = hass.data[KEY_GATEWAY][entry.entry_id]
+
+    latency = Histogram(BUCKETS)
+    lag = Histogram(BUCKETS)
+    # wall clock (start, end) of every handled chunk, to match state writes
+    windows = []
+    frames = 0
+
+    handle_messages = driver._handle_messages
+    set_values = driver._set_values
+
+    def timed_handle_messages(data):
+        start = time.time()
+        handle_messages(data)
+        windows.append((start, time.time()))
+
+    def counted_set_values(values):
+        nonlocal frames
+        frames += 1
+        set_values(values)
+
+    driver._handle_messages = timed_handle_messages
+    driver._set_values = counted_set_values
+
+    @callback
+    def state_written(event):
+        new_state = event.data.get("new_state")
+        if new_state is None:
+            return
+        written = new_state.last_updated.timestamp()
+        i = bisect.bisect_right(windows, (written, float("inf"))) - 1
+        if i >= 0 and windows[i][1] >= written:
+            latency.observe(written - windows[i][0])
+
+    async def measure_lag():
+        while True:
+            start = time.monotonic()
+            await asyncio.sleep(LAG_INTERVAL)
+            lag.observe(max(0.0, time.monotonic() - start - LAG_INTERVAL))
+            keep = bisect.bisect_left(windows, (time.time() - WINDOW_KEEP,))
+            del windows[:keep]
+
+    remove_listener = hass.bus.async_listen(EVENT_STATE_CHANGED, state_written)
+    lag_task = asyncio.get_running_loop().create_task(measure_lag())
+    driver.start()
+
+    cpu = time.thread_time()
+    await asyncio.sleep(DURATION)
+    cpu = time.thread_time() - cpu
+
+    connected = driver.connected()
+    lag_task.cancel()
+    remove_listener()
+    await driver.async_stop()
+    thread.stop()
+
+    report = {
+        "commit": _commit(),
+        "duration_s": DURATION,
+        "rate": RATE,
+        "frames": frames,
+        "states_written": latency.count,
+        "latency_ms": _percentiles(latency),
+        "loop_lag_ms": _percentiles(lag),
+        "cpu_us_per_frame": round(cpu / frames * 1e6, 2) if frames else None,
+    }
+    previous = None
+    if COMPARE:
+        with open(COMPARE, encoding="utf-8") as file:
+            previous = json.load(file)
+    _print_report(report, previous)
+    with open(REPORT, "w", encoding="utf-8") as file:
+        json.dump(report, file, indent=2)
+        file.write("\n")
+
+    assert connected
+    assert frames
+    assert latency.count